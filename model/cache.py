@@ -0,0 +1,96 @@
+import hashlib
+import numpy as np
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+def get_img_hash(img: np.ndarray):
+    # a gray image repeated into 3 channels is hashed once, tagged apart from a real 3-channel image
+    repeated = img.ndim == 3 and img.strides[2] == 0
+    digest = hashlib.blake2b(str((img.shape, img.dtype.str, repeated)).encode(), digest_size=20)
+    if repeated:
+        img = img[..., 0]
+    if img.flags.c_contiguous:
+        digest.update(memoryview(img).cast('B'))
+    else:
+        # other views, a row at a time instead of a whole copy
+        for row in img:
+            digest.update(memoryview(np.ascontiguousarray(row)).cast('B'))
+    return digest.hexdigest()
+
+
+# the weights file, and the external data next to it for ONNX
+def get_model_hash(name: str, model_path: str):
+    digest = hashlib.blake2b(name.encode(), digest_size=20)
+    for path in (model_path, model_path + '.data'):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as file:
+            while chunk := file.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_default_cache_path():
+    return os.path.join(os.path.expanduser('~'), '.label_dcm', 'predictions.sqlite')
+
+
+class PredictionCache:
+    """
+    (model hash, image content hash) -> predicted coordinates and per-joint confidences
+
+    engines sharing the file keep their own entries, the least recently used
+    entries of any model are evicted beyond max_entries
+    """
+
+    def __init__(self, model_hash: str, path: Optional[str] = None, max_entries: int = 50000):
+        self.model_hash = model_hash
+        self.path = path or get_default_cache_path()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions '
+                '(model TEXT, key TEXT, preds BLOB, maxvals BLOB, joints INTEGER, used REAL, '
+                'PRIMARY KEY (model, key))'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS predictions_used ON predictions (used)')
+
+    def get(self, img_hash: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                'SELECT preds, maxvals, joints FROM predictions WHERE model = ? AND key = ?',
+                (self.model_hash, img_hash)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                'UPDATE predictions SET used = ? WHERE model = ? AND key = ?', (time.time(), self.model_hash, img_hash)
+            )
+        preds, maxvals, joints = row
+        return np.frombuffer(preds).reshape(joints, 2), np.frombuffer(maxvals).reshape(joints, 1)
+
+    def put(self, img_hash: str, preds: np.ndarray, maxvals: np.ndarray):
+        preds = np.ascontiguousarray(preds, dtype=np.float64)
+        maxvals = np.ascontiguousarray(maxvals, dtype=np.float64)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)',
+                (self.model_hash, img_hash, preds.tobytes(), maxvals.tobytes(), len(preds), time.time())
+            )
+            # counted in the file, the GUI and the batch CLI may both be writing to it
+            count = self.conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM predictions WHERE rowid IN (SELECT rowid FROM predictions ORDER BY used LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
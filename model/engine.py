@@ -0,0 +1,88 @@
+import abc
+import numpy as np
+from model.unet import get_pose_net
+import torch
+
+
+class Engine(abc.ABC):
+    """
+    (N, 3, 512, 256) input -> (N, 37, 512, 256) float32 heatmaps
+    """
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+
+    @abc.abstractmethod
+    def __call__(self, input_map) -> np.ndarray:
+        pass
+
+
+def load_unet(model_path='static/model_best.pth'):
+    model = get_pose_net(37)
+    model.load_state_dict(torch.load(model_path, map_location='cpu'), strict=False)
+    return model.eval()
+
+
+# eager UNet without autograd
+class TorchEngine(Engine):
+    def __init__(self, model_path='static/model_best.pth'):
+        super().__init__(model_path)
+        self.model = self.load(model_path)
+
+    @staticmethod
+    def load(model_path: str):
+        return load_unet(model_path)
+
+    def __call__(self, input_map):
+        with torch.no_grad():
+            return self.model(torch.as_tensor(input_map, dtype=torch.float32)).numpy()
+
+
+# frozen TorchScript exported by model.export
+class TorchScriptEngine(TorchEngine):
+    def __init__(self, model_path='static/model_best.pt'):
+        super().__init__(model_path)
+
+    @staticmethod
+    def load(model_path: str):
+        return torch.jit.load(model_path, map_location='cpu')
+
+
+def get_quantized_backend():
+    backends = torch.backends.quantized.supported_engines
+    return 'x86' if 'x86' in backends else 'fbgemm'
+
+
+# INT8 TorchScript written by model.quantize
+class QuantizedEngine(TorchScriptEngine):
+    def __init__(self, model_path='static/model_int8.pt'):
+        super().__init__(model_path)
+
+    @staticmethod
+    def load(model_path: str):
+        torch.backends.quantized.engine = get_quantized_backend()
+        return torch.jit.load(model_path, map_location='cpu')
+
+
+# graph optimized ONNX Runtime on CPU, onnxruntime is only needed by this engine
+class OnnxEngine(Engine):
+    def __init__(self, model_path='static/model_best.onnx', threads=0):
+        super().__init__(model_path)
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, input_map):
+        return self.session.run(None, {self.input_name: np.asarray(input_map, dtype=np.float32)})[0]
+
+
+engines = dict(torch=TorchEngine, torchscript=TorchScriptEngine, int8=QuantizedEngine, onnx=OnnxEngine)
+
+
+def get_engine(name='torch', model_path=None) -> Engine:
+    if name not in engines:
+        raise ValueError(f"unknown engine '{name}', expected one of {', '.join(engines)}")
+    return engines[name](model_path) if model_path else engines[name]()
@@ -0,0 +1,73 @@
+import argparse
+from model.engine import Engine, get_engine, load_unet
+import numpy as np
+import os
+import sys
+import torch
+from typing import Dict, List, Optional
+
+
+input_shape = (1, 3, 512, 256)
+
+
+def export_torchscript(model: torch.nn.Module, path: str):
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, torch.zeros(input_shape)))
+    traced.save(path)
+
+
+# the exporter's own opset by default, converting to another one may not be supported by it
+def export_onnx(model: torch.nn.Module, path: str, opset: Optional[int] = None):
+    torch.onnx.export(
+        model, torch.zeros(input_shape), path, input_names=['input'], output_names=['heatmaps'],
+        dynamic_axes=dict(input={0: 'batch'}, heatmaps={0: 'batch'}), opset_version=opset
+    )
+
+
+# the same heatmaps from every engine, compared with the first one
+def check_parity(engines: Dict[str, Engine], batch_size: int = 2, atol: float = 1e-3):
+    input_map = torch.randn((batch_size,) + input_shape[1:], generator=torch.Generator().manual_seed(0))
+    input_map /= input_map.abs().max()
+    outputs = {name: engine(input_map) for name, engine in engines.items()}
+    base_name, base = next(iter(outputs.items()))
+    passed = True
+    for name, output in outputs.items():
+        diff = float(np.max(np.abs(output - base)))
+        ok = diff <= atol * max(float(np.max(np.abs(base))), 1)
+        passed = passed and ok
+        print(f'{name}: max |{name} - {base_name}| = {diff:.3g} {"ok" if ok else "FAILED"}')
+    return passed
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m model.export', description='export the UNet weights to TorchScript and ONNX'
+    )
+    parser.add_argument('-w', '--weights', default='static/model_best.pth', help='state dict of the UNet')
+    parser.add_argument('--torchscript', help='default: <weights>.pt')
+    parser.add_argument('--onnx', help='default: <weights>.onnx')
+    parser.add_argument('--opset', type=int, help="ONNX opset version, default: the exporter's own")
+    parser.add_argument('--atol', type=float, default=1e-3, help='parity tolerance relative to the heatmap peak')
+    parser.add_argument('--skip-check', action='store_true', help="don't compare the engines afterwards")
+    args = parser.parse_args(argv)
+
+    stem = os.path.splitext(args.weights)[0]
+    torchscript_path = args.torchscript or stem + '.pt'
+    onnx_path = args.onnx or stem + '.onnx'
+    model = load_unet(args.weights)
+    export_torchscript(model, torchscript_path)
+    print(f'torchscript: {torchscript_path}')
+    export_onnx(model, onnx_path, args.opset)
+    print(f'onnx: {onnx_path}')
+    if args.skip_check:
+        return 0
+
+    engines = dict(
+        torch=get_engine('torch', args.weights), torchscript=get_engine('torchscript', torchscript_path),
+        onnx=get_engine('onnx', onnx_path)
+    )
+    return 0 if check_parity(engines, atol=args.atol) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
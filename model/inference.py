@@ -90,16 +90,90 @@ def gaussian_blur(hm, kernel):
     return hm
 
 
-def get_final_preds(config, hm):
+# 以 coords 为中心取出 (2 * radius + 1) 见方的小块，图外补 0
+def get_patches(hm, coords, radius):
+    batch_size, num_joints, height, width = hm.shape
+    offsets = np.arange(-radius, radius + 1)
+    ys = coords[:, :, 1].astype(np.int64)[:, :, np.newaxis] + offsets
+    xs = coords[:, :, 0].astype(np.int64)[:, :, np.newaxis] + offsets
+    n, j = np.indices((batch_size, num_joints))
+    patches = hm[
+        n[:, :, np.newaxis, np.newaxis], j[:, :, np.newaxis, np.newaxis],
+        np.clip(ys, 0, height - 1)[:, :, :, np.newaxis], np.clip(xs, 0, width - 1)[:, :, np.newaxis, :]
+    ]
+    inside = ((0 <= ys) & (ys < height))[:, :, :, np.newaxis] & ((0 <= xs) & (xs < width))[:, :, np.newaxis, :]
+    return np.where(inside, patches, 0).astype(np.float64)
+
+
+# 与 gaussian_blur 补 0 后的卷积相同，每边缩小 (kernel - 1) // 2
+def gaussian_blur_patches(patches, kernel):
+    weights = cv2.getGaussianKernel(kernel, 0).ravel()
+    patches = np.lib.stride_tricks.sliding_window_view(patches, kernel, axis=3) @ weights
+    patches = np.lib.stride_tricks.sliding_window_view(patches, kernel, axis=2) @ weights
+    return patches
+
+
+def taylor_batch(hm, coords):
+    """
+    taylor for every joint at once, hm: (N, J, 5, 5) log patches centered at coords
+    the 2x2 Hessian is inverted in closed form
+    """
+    dx = 0.5 * (hm[:, :, 2, 3] - hm[:, :, 2, 1])
+    dy = 0.5 * (hm[:, :, 3, 2] - hm[:, :, 1, 2])
+    dxx = 0.25 * (hm[:, :, 2, 4] - 2 * hm[:, :, 2, 2] + hm[:, :, 2, 0])
+    dxy = 0.25 * (hm[:, :, 3, 3] - hm[:, :, 1, 3] - hm[:, :, 3, 1] + hm[:, :, 1, 1])
+    dyy = 0.25 * (hm[:, :, 4, 2] - 2 * hm[:, :, 2, 2] + hm[:, :, 0, 2])
+    det = dxx * dyy - dxy ** 2
+    valid = det != 0
+    det = np.where(valid, det, 1)
+
+    # offset = -H^-1 · d, H^-1 = [[dyy, -dxy], [-dxy, dxx]] / det
+    coords[:, :, 0] -= np.where(valid, (dyy * dx - dxy * dy) / det, 0)
+    coords[:, :, 1] -= np.where(valid, (dxx * dy - dxy * dx) / det, 0)
+    return coords
+
+
+# gaussian_blur 中整张热图模糊后的最大值
+def get_blurred_max(hm, kernel):
+    border = (kernel - 1) // 2
+    dr = np.zeros((hm.shape[0] + 2 * border, hm.shape[1] + 2 * border))
+    dr[border: -border, border: -border] = hm
+    return np.max(cv2.GaussianBlur(dr, (kernel, kernel), 0)[border: -border, border: -border])
+
+
+def decode_heatmaps(hm, kernel):
+    """
+    get_max_preds + gaussian_blur + log + taylor for a whole (N, J, H, W) batch
+
+    taylor only reads the 5x5 neighbourhood of the maximum, so only the patch
+    it depends on is blurred. log differences are scale invariant, so the
+    rescale to the original peak only matters where the 1e-10 floor clips the
+    patch, and only those joints blur their whole heatmap to get the exact scale
+    """
     coords, maxvals = get_max_preds(hm)
+    height = hm.shape[2]
+    width = hm.shape[3]
+    px = coords[:, :, 0]
+    py = coords[:, :, 1]
+    inside = (1 < px) & (px < width - 2) & (1 < py) & (py < height - 2)
 
     # post-processing
-    hm = gaussian_blur(hm, config.TEST.BLUR_KERNEL)
-    hm = np.maximum(hm, 1e-10)
-    hm = np.log(hm)
-    for n in range(coords.shape[0]):
-        for p in range(coords.shape[1]):
-            coords[n, p] = taylor(hm[n][p], coords[n][p])
+    patches = gaussian_blur_patches(get_patches(hm, coords, (kernel - 1) // 2 + 2), kernel)
+
+    # the whole blurred heatmap is at most its original peak, so the scale is at least 1
+    # and a patch above the floor is never clipped
+    scales = np.ones(inside.shape)
+    for n, j in zip(*np.nonzero(inside & (np.min(patches, axis=(2, 3)) < 1e-10))):
+        blurred_max = get_blurred_max(hm[n, j], kernel)
+        scales[n, j] = maxvals[n, j, 0] / blurred_max if blurred_max != 0 else 1
+    patches *= scales[:, :, np.newaxis, np.newaxis]
+    patches = np.log(np.maximum(patches, 1e-10))
 
     preds = coords.copy()
+    taylor_batch(patches, preds)
+    preds[~inside] = coords[~inside]
     return preds, maxvals
+
+
+def get_final_preds(config, hm):
+    return decode_heatmaps(hm, config.TEST.BLUR_KERNEL)
@@ -0,0 +1,119 @@
+import argparse
+import copy
+import json
+from model import test
+from model.engine import Engine, get_engine, get_quantized_backend, load_unet
+import numpy as np
+import sys
+import time
+import torch
+from typing import List, Optional
+
+
+# static post-training quantization, calibrated on preprocessed sample images
+def quantize_unet(model: torch.nn.Module, calib_inputs: List[torch.Tensor], path: str):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    backend = get_quantized_backend()
+    torch.backends.quantized.engine = backend
+    example = calib_inputs[0].unsqueeze(0)
+    model = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(backend), (example,))
+    with torch.no_grad():
+        for input_map in calib_inputs:
+            model(input_map.unsqueeze(0))
+        model = torch.jit.freeze(torch.jit.trace(convert_fx(model), example))
+    model.save(path)
+
+
+# every frame of a multi-frame DICOM is a sample of its own, as in module.batch
+def load_samples(root: str):
+    from module.batch import get_item_name, get_path_items, load_item_img, walk_img_paths
+    from module.frames import DicomFrames
+    inputs = []
+    ori_sizes = []
+    for path in walk_img_paths(root):
+        try:
+            items = get_path_items(path)
+            frames = DicomFrames(path, 0) if len(items) > 1 else None
+        except Exception as err:
+            print(f'{path}: skipped, {err}', file=sys.stderr)
+            continue
+        for item in items:
+            try:
+                img = load_item_img(item, frames)
+                inputs.append(test.normalize_image(img))
+            except Exception as err:
+                print(f'{get_item_name(item)}: skipped, {err}', file=sys.stderr)
+                continue
+            ori_sizes.append(img.shape[:2])
+    return inputs, ori_sizes
+
+
+def get_latency(engine: Engine, inputs: List[torch.Tensor]):
+    engine(inputs[0].unsqueeze(0))
+    begin = time.perf_counter()
+    for input_map in inputs:
+        engine(input_map.unsqueeze(0))
+    return (time.perf_counter() - begin) / len(inputs) * 1000
+
+
+def get_preds(engine: Engine, inputs: List[torch.Tensor], ori_sizes: list):
+    return np.concatenate([
+        test.get_ori_preds(engine(input_map.unsqueeze(0)), [ori_size])
+        for input_map, ori_size in zip(inputs, ori_sizes)
+    ])
+
+
+# landmark error in pixels on the original images, INT8 against FP32
+def get_report(fp32: Engine, int8: Engine, inputs: List[torch.Tensor], ori_sizes: list):
+    error = np.linalg.norm(get_preds(int8, inputs, ori_sizes) - get_preds(fp32, inputs, ori_sizes), axis=2)
+    fp32_ms = get_latency(fp32, inputs)
+    int8_ms = get_latency(int8, inputs)
+    return dict(
+        images=len(inputs), error_mean_px=float(np.mean(error)), error_median_px=float(np.median(error)),
+        error_p95_px=float(np.percentile(error, 95)), error_max_px=float(np.max(error)),
+        error_per_joint_px=[float(e) for e in np.mean(error, axis=0)],
+        fp32_ms=fp32_ms, int8_ms=int8_ms, speedup=fp32_ms / int8_ms
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m model.quantize', description='quantize the UNet to INT8 and compare it with FP32'
+    )
+    parser.add_argument('samples', help='directory of local sample images for calibration and evaluation')
+    parser.add_argument('-w', '--weights', default='static/model_best.pth', help='FP32 state dict of the UNet')
+    parser.add_argument('-o', '--output', default='static/model_int8.pt', help='INT8 TorchScript')
+    parser.add_argument('--calib', type=int, default=32, help='images used for calibration, the rest for the report')
+    parser.add_argument('--report', help='also write the report as JSON')
+    args = parser.parse_args(argv)
+
+    inputs, ori_sizes = load_samples(args.samples)
+    if not inputs:
+        parser.error(f'no images under {args.samples}')
+    calib = min(args.calib, len(inputs))
+
+    # too few samples to split, evaluate on the calibration set
+    eval_begin = calib if calib < len(inputs) else 0
+    quantize_unet(load_unet(args.weights), inputs[:calib], args.output)
+    report = get_report(
+        get_engine('torch', args.weights), get_engine('int8', args.output), inputs[eval_begin:],
+        ori_sizes[eval_begin:]
+    )
+    print(f'calibrated on {calib} images, evaluated on {report["images"]} images')
+    print(
+        f'landmark error (px): mean {report["error_mean_px"]:.2f}, median {report["error_median_px"]:.2f}, '
+        f'p95 {report["error_p95_px"]:.2f}, max {report["error_max_px"]:.2f}'
+    )
+    print(
+        f'latency (ms / image): fp32 {report["fp32_ms"]:.1f}, int8 {report["int8_ms"]:.1f}, '
+        f'speedup {report["speedup"]:.2f}x'
+    )
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
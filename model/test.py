@@ -1,8 +1,12 @@
 import cv2
+from model.cache import get_model_hash, PredictionCache
+from model.engine import Engine, get_engine, load_unet
+from model.inference import decode_heatmaps
 import numpy as np
-from model.inference import gaussian_blur, get_max_preds, taylor
-from model.unet import get_pose_net
+import os
+import threading
 import torch
+from typing import Optional
 
 
 def convert_img(img):
@@ -21,68 +25,129 @@ def convert_img(img):
     return img
 
 
-# -----------定义图片预处理--------------------------
-def load_and_convert_image(ori_img, input_imag_size=(256, 512), convert=True):
-    img = cv2.resize(ori_img, input_imag_size)
-
-    ori_img = np.array(ori_img)
-    ori_img = torch.from_numpy(ori_img).float()
+def normalize_image(ori_img, input_imag_size=(256, 512), convert=True):
+    if ori_img.ndim == 3 and ori_img.strides[2] == 0:
+        # 灰度图重复成的三通道视图，只缩放一个通道
+        img = np.repeat(cv2.resize(np.ascontiguousarray(ori_img[..., 0]), input_imag_size)[..., np.newaxis], 3, axis=2)
+    else:
+        img = cv2.resize(ori_img, input_imag_size)
     img = np.array(img)
     if convert:
         img = convert_img(img)
     img = img - img.mean()
     img /= img.std()
     img /= img.max()
+    return img
+
+
+# -----------定义图片预处理--------------------------
+def load_and_convert_image(ori_img, input_imag_size=(256, 512), convert=True):
+    img = normalize_image(ori_img, input_imag_size, convert)
+
+    ori_img = np.array(ori_img)
+    ori_img = torch.from_numpy(ori_img).float()
 
     return img.unsqueeze(dim=0), ori_img.unsqueeze(dim=0)  # chw: channel height width
 
 
+# 大小不同的多张图片 -> (N, C, H, W) 的输入与每张原图的 (h, w)
+def load_and_convert_images(ori_imgs, input_imag_size=(256, 512)):
+    input_map = torch.stack([normalize_image(ori_img, input_imag_size) for ori_img in ori_imgs])
+    ori_sizes = np.array([ori_img.shape[:2] for ori_img in ori_imgs]).reshape(-1, 2)
+    return input_map, ori_sizes
+
+
 def get_pred(hm):
-    coords, maxvals = get_max_preds(hm)
+    return decode_heatmaps(hm, 11)
+
 
-    # post-processing
-    hm = gaussian_blur(hm, 11)
-    hm = np.maximum(hm, 1e-10)
-    hm = np.log(hm)
-    for n in range(coords.shape[0]):
-        for p in range(coords.shape[1]):
-            coords[n, p] = taylor(hm[n][p], coords[n][p])
+def get_heatmaps(model, input_map):
+    if isinstance(model, Engine):
+        return model(input_map)
+    with torch.no_grad():
+        return model(input_map).numpy()
 
-    preds = coords.copy()
-    return preds, maxvals
+
+# 将热图上的关键点映射回各自的原图, ori_sizes: (N, 2) 的 (h, w), 同时返回每个关键点的置信度
+def get_ori_preds_and_maxvals(hm, ori_sizes):
+    pred, maxvals = get_pred(hm)
+    out_h = hm.shape[2]
+    out_w = hm.shape[3]
+    ori_sizes = np.asarray(ori_sizes, dtype=np.float64).reshape(-1, 2)
+    norm = np.stack([ori_sizes[:, 1] / out_w, ori_sizes[:, 0] / out_h], axis=1).reshape(-1, 1, 2)
+    return pred * norm, maxvals
+
+
+def get_ori_preds(hm, ori_sizes):
+    return get_ori_preds_and_maxvals(hm, ori_sizes)[0]
 
 
 # --------------------模型预测-----------------------------
 # 使用模型对指定图片文件路径完成图像分类，返回值为预测的种类名称
 def predict_image(model, input_map, ori_img):
-    output = model(input_map)
-    out_shape = output.shape
-    pred, _ = get_pred(output.detach().numpy())
+    return predict_images(model, input_map, [ori_img.shape[1:3]])
 
-    ori_w = ori_img.shape[2]
-    ori_h = ori_img.shape[1]
-    out_w = out_shape[3]
-    out_h = out_shape[2]
 
-    batch_size = output.shape[0]
-    norm = np.array([ori_w / out_w, ori_h / out_h]).reshape(batch_size, 1, 2)
-    pred = pred * norm
-    return pred
+# 一次前向传播预测整批图片
+def predict_images(model, input_map, ori_sizes):
+    return get_ori_preds(get_heatmaps(model, input_map), ori_sizes)
 
 
 def load_model(model_path='static/model_best.pth'):
-    model = get_pose_net(37)
-    model.load_state_dict(torch.load(model_path, map_location='cpu'), strict=False)
-    return model
+    return load_unet(model_path)
+
+
+# torch / torchscript / int8 / onnx, see model.engine
+engine_name = os.getenv('LABEL_DCM_ENGINE', 'torch')
+engine_path = os.getenv('LABEL_DCM_ENGINE_PATH')
+
+model = None
+model_lock = threading.Lock()
+
+# predictions of the current model, see model.cache
+cache: Optional[PredictionCache] = None
+
 
+# 第一次使用时才加载模型
+def get_model():
+    global model
+    with model_lock:
+        if model is None:
+            model = get_engine(engine_name, engine_path)
+        return model
 
-model = load_model()
+
+def set_engine(name: str, model_path=None):
+    global engine_name, engine_path, model, cache
+    with model_lock:
+        engine_name = name
+        engine_path = model_path
+        model = None
+        cache = None
+
+
+def get_cache():
+    global cache
+    engine = get_model()
+    with model_lock:
+        if cache is None:
+            cache = PredictionCache(get_model_hash(engine_name, engine.model_path))
+        return cache
+
+
+def is_model_loaded():
+    return model is not None
 
 
 def auto_get_points(img):
     input_map, ori_img = load_and_convert_image(img)
 
     # 得到关键点
-    result = predict_image(model, input_map, ori_img)
+    result = predict_image(get_model(), input_map, ori_img)
 
     return result[0]
+
+
+def auto_get_points_batch(imgs):
+    input_map, ori_sizes = load_and_convert_images(imgs)
+    return predict_images(get_model(), input_map, ori_sizes)
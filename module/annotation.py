@@ -0,0 +1,344 @@
+from collections import defaultdict
+import heapq
+from module import geometry, utils
+from module.config import config
+import numpy
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QColor
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+class Erased:
+    """
+    the keys of the annotations an edit of the store erased, a renumbered point and its shapes under the old indexs
+    """
+
+    def __init__(
+            self, points: Iterable[int] = (), lines: Iterable[Tuple[int, int]] = (),
+            angles: Iterable[Tuple[int, int, int]] = (), circles: Iterable[Tuple[int, int]] = ()
+    ):
+        self.points: Set[int] = set(points)
+        self.lines: Set[Tuple[int, int]] = set(lines)
+        self.angles: Set[Tuple[int, int, int]] = set(angles)
+        self.circles: Set[Tuple[int, int]] = set(circles)
+
+    def update(self, erased: 'Erased'):
+        self.points.update(erased.points)
+        self.lines.update(erased.lines)
+        self.angles.update(erased.angles)
+        self.circles.update(erased.circles)
+
+    def is_empty(self):
+        return not (self.points or self.lines or self.angles or self.circles)
+
+    def clear(self):
+        self.points.clear()
+        self.lines.clear()
+        self.angles.clear()
+        self.circles.clear()
+
+
+class AnnotationStore:
+    """
+    points, the lines, angles and circles on them, and the pivots
+
+    every point knows its incident shapes, so erasing and renumbering cost O(degree) and return the keys erased,
+    and the indexs are kept in a max heap for the next new index
+    """
+
+    def __init__(self):
+        # a: index_a - a, color
+        self.points: Dict[int, Tuple[QPointF, QColor]] = {}
+
+        # ab: index_a, index_b - color
+        self.lines: Dict[Tuple[int, int], QColor] = {}
+
+        # ∠abc: index_a, index_b, index_c - color
+        self.angles: Dict[Tuple[int, int, int], QColor] = {}
+
+        # ⊙a, r = ab: index_a, index_b - color
+        self.circles: Dict[Tuple[int, int], QColor] = {}
+
+        self.pivots: Set[int] = set()
+
+        # index - keys of the shapes on it
+        self.point_lines: Dict[int, Set[Tuple[int, int]]] = defaultdict(set)
+        self.point_angles: Dict[int, Set[Tuple[int, int, int]]] = defaultdict(set)
+        self.point_circles: Dict[int, Set[Tuple[int, int]]] = defaultdict(set)
+
+        # -index, stale entries are dropped lazily
+        self.heap: List[int] = []
+
+    def clear(self):
+        self.points.clear()
+        self.lines.clear()
+        self.angles.clear()
+        self.circles.clear()
+        self.pivots.clear()
+        self.point_lines.clear()
+        self.point_angles.clear()
+        self.point_circles.clear()
+        self.heap.clear()
+
+    # max + 1, 1 without points
+    def get_new_index(self):
+        while self.heap and -self.heap[0] not in self.points:
+            heapq.heappop(self.heap)
+        return -self.heap[0] + 1 if self.heap else 1
+
+    def set_point(self, index: int, point: QPointF, color: QColor):
+        if index not in self.points:
+            heapq.heappush(self.heap, -index)
+        self.points[index] = point, color
+
+    def add_line(self, index_a: int, index_b: int, color: QColor):
+        key = utils.get_line_key(index_a, index_b)
+        self.lines[key] = color
+        add_incident(self.point_lines, key)
+
+    def add_angle(self, index_a: int, index_b: int, index_c: int, color: QColor):
+        key = utils.get_angle_key(index_a, index_b, index_c)
+        self.angles[key] = color
+        add_incident(self.point_angles, key)
+
+    def add_circle(self, index_a: int, index_b: int, color: QColor):
+        self.circles[(index_a, index_b)] = color
+        add_incident(self.point_circles, (index_a, index_b))
+
+    def get_lines_of(self, indexs: Iterable[int]):
+        return get_incident(self.point_lines, indexs)
+
+    def get_angles_of(self, indexs: Iterable[int]):
+        return get_incident(self.point_angles, indexs)
+
+    def get_circles_of(self, indexs: Iterable[int]):
+        return get_incident(self.point_circles, indexs)
+
+    def erase_angle(self, key: Tuple[int, int, int]):
+        self.angles.pop(key)
+        remove_incident(self.point_angles, key)
+
+    # with the angles on it
+    def erase_line(self, key: Tuple[int, int]):
+        self.lines.pop(key)
+        remove_incident(self.point_lines, key)
+        erased = Erased(lines=[key])
+        for angle in list(self.point_angles.get(key[0], ())):
+            if key in (utils.get_line_key(angle[0], angle[1]), utils.get_line_key(angle[1], angle[2])):
+                self.erase_angle(angle)
+                erased.angles.add(angle)
+        return erased
+
+    def erase_circle(self, key: Tuple[int, int]):
+        self.circles.pop(key)
+        remove_incident(self.point_circles, key)
+        return Erased(circles=[key])
+
+    # with the shapes on it
+    def erase_point(self, index: int):
+        self.points.pop(index)
+        erased = self.get_erased_of(index)
+        for line in erased.lines:
+            self.lines.pop(line)
+            remove_incident(self.point_lines, line)
+        for angle in erased.angles:
+            self.erase_angle(angle)
+        for circle in erased.circles:
+            self.erase_circle(circle)
+        self.pivots.discard(index)
+        return erased
+
+    # the point and the shapes on it
+    def get_erased_of(self, index: int):
+        return Erased(
+            [index], self.point_lines.get(index, ()), self.point_angles.get(index, ()),
+            self.point_circles.get(index, ())
+        )
+
+    # new_index must be free, the shapes on it are found from new_index afterwards
+    def rename_point(self, index: int, new_index: int):
+        self.set_point(new_index, *self.points.pop(index))
+        erased = self.get_erased_of(index)
+        for line in list(self.point_lines.get(index, ())):
+            color = self.lines.pop(line)
+            remove_incident(self.point_lines, line)
+            self.add_line(new_index, line[0] + line[1] - index, color)
+        for angle in list(self.point_angles.get(index, ())):
+            color = self.angles.pop(angle)
+            remove_incident(self.point_angles, angle)
+            if index == angle[1]:
+                self.angles[angle[0], new_index, angle[2]] = color
+                add_incident(self.point_angles, (angle[0], new_index, angle[2]))
+            else:
+                self.add_angle(new_index, angle[1], angle[0] + angle[2] - index, color)
+        for circle in list(self.point_circles.get(index, ())):
+            color = self.circles.pop(circle)
+            remove_incident(self.point_circles, circle)
+            key = (new_index, circle[1]) if index == circle[0] else (circle[0], new_index)
+            self.add_circle(key[0], key[1], color)
+        if index in self.pivots:
+            self.pivots.remove(index)
+            self.pivots.add(new_index)
+        return erased
+
+
+def add_incident(incident: Dict[int, Set], key: Tuple[int, ...]):
+    for index in key:
+        incident[index].add(key)
+
+
+def remove_incident(incident: Dict[int, Set], key: Tuple[int, ...]):
+    for index in key:
+        if keys := incident.get(index):
+            keys.discard(key)
+            if not keys:
+                del incident[index]
+
+
+def get_incident(incident: Dict[int, Set], indexs: Iterable[int]):
+    keys: Set[Hashable] = set()
+    for index in indexs:
+        keys.update(incident.get(index, ()))
+    return keys
+
+
+def get_default_palette():
+    return [QColor(color).name() for color in config.color_list]
+
+
+class LabelArrays:
+    """
+    a columnar copy of the labels of one image
+
+    ids, xy: the indexs and source coordinates of the points
+    lines, angles, circles: indexs of their points, one row per shape
+    *_colors: indexs into palette, which starts with config.color_list and grows with unknown colors
+
+    rows keep the order of the JSON layout of LabelApp.export_all, so converting back and forth is lossless
+    """
+
+    def __init__(self, palette: Optional[List[str]] = None):
+        self.palette = palette if palette is not None else get_default_palette()
+        self.ids = numpy.zeros(0, dtype=numpy.int64)
+        self.xy = numpy.zeros((0, 2), dtype=numpy.float64)
+        self.point_colors = numpy.zeros(0, dtype=numpy.int32)
+        self.lines = numpy.zeros((0, 2), dtype=numpy.int64)
+        self.line_colors = numpy.zeros(0, dtype=numpy.int32)
+        self.angles = numpy.zeros((0, 3), dtype=numpy.int64)
+        self.angle_colors = numpy.zeros(0, dtype=numpy.int32)
+        self.circles = numpy.zeros((0, 2), dtype=numpy.int64)
+        self.circle_colors = numpy.zeros(0, dtype=numpy.int32)
+        self.pivots = numpy.zeros(0, dtype=numpy.int64)
+
+    def get_color_index(self, color: str):
+        try:
+            return self.palette.index(color)
+        except ValueError:
+            self.palette.append(color)
+            return len(self.palette) - 1
+
+    def get_color_indexs(self, colors: Sequence[str]):
+        return numpy.array([self.get_color_index(color) for color in colors], dtype=numpy.int32)
+
+    # both layouts of import_labels, points of the pivots only layout take color
+    @classmethod
+    def from_json(cls, data: dict, color: str = config.default_color):
+        arrays = cls()
+        if len(data) == 1:
+            pivots = data['pivots']
+            arrays.ids = numpy.array([pivot[0] for pivot in pivots], dtype=numpy.int64)
+            arrays.xy = numpy.array([pivot[1:3] for pivot in pivots], dtype=numpy.float64).reshape(-1, 2)
+            arrays.point_colors = numpy.full(len(pivots), arrays.get_color_index(color), dtype=numpy.int32)
+            arrays.pivots = arrays.ids.copy()
+            return arrays
+        points = data['points']
+        arrays.ids = numpy.array([point[0] for point in points], dtype=numpy.int64)
+        arrays.xy = numpy.array([point[1:3] for point in points], dtype=numpy.float64).reshape(-1, 2)
+        arrays.point_colors = arrays.get_color_indexs([point[3] for point in points])
+        arrays.lines = numpy.array([line[:2] for line in data['lines']], dtype=numpy.int64).reshape(-1, 2)
+        arrays.line_colors = arrays.get_color_indexs([line[2] for line in data['lines']])
+        arrays.angles = numpy.array([angle[:3] for angle in data['angles']], dtype=numpy.int64).reshape(-1, 3)
+        arrays.angle_colors = arrays.get_color_indexs([angle[3] for angle in data['angles']])
+        arrays.circles = numpy.array([circle[:2] for circle in data['circles']], dtype=numpy.int64).reshape(-1, 2)
+        arrays.circle_colors = arrays.get_color_indexs([circle[2] for circle in data['circles']])
+        arrays.pivots = numpy.array(data['pivots'], dtype=numpy.int64)
+        return arrays
+
+    def to_json(self):
+        palette = self.palette
+        return dict(
+            points=[
+                (index, x, y, palette[color])
+                for index, (x, y), color in zip(self.ids.tolist(), self.xy.tolist(), self.point_colors.tolist())
+            ],
+            lines=[(a, b, palette[color]) for (a, b), color in zip(self.lines.tolist(), self.line_colors.tolist())],
+            angles=[
+                (a, b, c, palette[color]) for (a, b, c), color in zip(self.angles.tolist(), self.angle_colors.tolist())
+            ],
+            circles=[
+                (a, b, palette[color]) for (a, b), color in zip(self.circles.tolist(), self.circle_colors.tolist())
+            ],
+            pivots=self.pivots.tolist()
+        )
+
+    # the layout of LabelApp.export_pivots
+    def to_pivots_json(self):
+        xy = self.xy[self.get_rows(self.pivots)]
+        return dict(pivots=[(index, x, y) for index, (x, y) in zip(self.pivots.tolist(), xy.tolist())])
+
+    @classmethod
+    def from_store(cls, store: AnnotationStore):
+        arrays = cls()
+        points = store.points
+        arrays.ids = numpy.fromiter(points.keys(), dtype=numpy.int64, count=len(points))
+        arrays.xy = numpy.array([(point.x(), point.y()) for point, _ in points.values()], dtype=numpy.float64) \
+            .reshape(-1, 2)
+        arrays.point_colors = arrays.get_color_indexs([color.name() for _, color in points.values()])
+        arrays.lines = numpy.array(list(store.lines.keys()), dtype=numpy.int64).reshape(-1, 2)
+        arrays.line_colors = arrays.get_color_indexs([color.name() for color in store.lines.values()])
+        arrays.angles = numpy.array(list(store.angles.keys()), dtype=numpy.int64).reshape(-1, 3)
+        arrays.angle_colors = arrays.get_color_indexs([color.name() for color in store.angles.values()])
+        arrays.circles = numpy.array(list(store.circles.keys()), dtype=numpy.int64).reshape(-1, 2)
+        arrays.circle_colors = arrays.get_color_indexs([color.name() for color in store.circles.values()])
+        arrays.pivots = numpy.array(list(store.pivots), dtype=numpy.int64)
+        return arrays
+
+    def update_store(self, store: AnnotationStore):
+        colors = [QColor(color) for color in self.palette]
+        for index, (x, y), color in zip(self.ids.tolist(), self.xy.tolist(), self.point_colors.tolist()):
+            store.set_point(index, QPointF(x, y), colors[color])
+        for (a, b), color in zip(self.lines.tolist(), self.line_colors.tolist()):
+            store.add_line(a, b, colors[color])
+        for (a, b, c), color in zip(self.angles.tolist(), self.angle_colors.tolist()):
+            store.add_angle(a, b, c, colors[color])
+        for (a, b), color in zip(self.circles.tolist(), self.circle_colors.tolist()):
+            store.add_circle(a, b, colors[color])
+        store.pivots.update(self.pivots.tolist())
+
+    # rows of the points with the indexs
+    def get_rows(self, indexs: numpy.ndarray):
+        order = numpy.argsort(self.ids, kind='stable')
+        rows = numpy.searchsorted(self.ids, indexs, sorter=order)
+        rows = order[numpy.minimum(rows, len(order) - 1)] if len(order) else rows
+        if len(indexs) and (not len(order) or numpy.any(self.ids[rows] != indexs)):
+            raise KeyError('unknown point index')
+        return rows
+
+    def get_line_points(self):
+        return self.xy[self.get_rows(self.lines[:, 0])], self.xy[self.get_rows(self.lines[:, 1])]
+
+    def get_angle_points(self):
+        return tuple(self.xy[self.get_rows(self.angles[:, i])] for i in range(3))
+
+    def get_circle_points(self):
+        return self.xy[self.get_rows(self.circles[:, 0])], self.xy[self.get_rows(self.circles[:, 1])]
+
+    def get_line_lengths(self, pixel_spacing: Optional[Tuple[float, float]] = None):
+        return geometry.get_lengths(*self.get_line_points(), pixel_spacing)
+
+    def get_angle_degrees(self):
+        return geometry.get_degrees(*self.get_angle_points())
+
+    # r = ab
+    def get_circle_radii(self, pixel_spacing: Optional[Tuple[float, float]] = None):
+        return geometry.get_lengths(*self.get_circle_points(), pixel_spacing)
@@ -1,13 +1,31 @@
-from model import test
-from module import utils
+import bisect
+from module import thumbnail, utils
+from module.annotation import AnnotationStore, Erased, LabelArrays
 from module.config import config
+from module.dirty import Dirty
+from module.frames import DicomFrames, rename_frame_path
 from module.mode import LabelMode
+from module.prefetch import DecodedImage, Prefetcher
+from module.scene import LabelScene
+from module.spatial import SpatialIndex
+from module.thumbnail import ThumbnailCache
+from module.voi import VoiWindow
+from module.worker import AutoLabeler, ImageOpener, ModelLoader, ThumbnailLoader
+import numpy
+import os
 from ui.form import Ui_form
-from PyQt5.QtCore import pyqtBoundSignal, QCoreApplication, QEvent, QObject, QPoint, QPointF, QRectF, QSize, Qt
-from PyQt5.QtGui import QColor, QCursor, QFont, QIcon, QMouseEvent, QPainter, QPen, QPixmap, QResizeEvent
-from PyQt5.QtWidgets import QAction, QFileDialog, QGraphicsScene, QInputDialog, QMainWindow, QMenu, QMessageBox, \
+from PyQt5.QtCore import pyqtBoundSignal, QCoreApplication, QEvent, QObject, QPoint, QPointF, QRectF, QSize, Qt, \
+                         QTimer
+from PyQt5.QtGui import QColor, QCursor, QFont, QIcon, QImage, QMouseEvent, QPainter, QPen, QPixmap, QResizeEvent, \
+                        QTransform
+from PyQt5.QtWidgets import QAction, QDockWidget, QFileDialog, QInputDialog, QLabel, QListView, QListWidget, \
+                            QListWidgetItem, QMainWindow, QMenu, QMessageBox, QProgressBar, QPushButton, QSpinBox, \
                             QStatusBar
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+def get_degree_text(deg: float):
+    return str(round(deg, 2)) + '°'
 
 
 class LabelApp(QMainWindow, Ui_form):
@@ -30,12 +48,31 @@ class LabelApp(QMainWindow, Ui_form):
         self.img_size = 1
 
         # init image
-        self.src: Optional[QPixmap] = None
-        self.img: Optional[QPixmap] = None
+        # img: size of the image shown, rendered from the source by the scene
+        self.mat: Optional[numpy.ndarray] = None
+        self.src: Optional[QImage] = None
+        self.voi: Optional[VoiWindow] = None
+        self.frames: Optional[DicomFrames] = None
+        self.frame = 0
+        self.img: Optional[QSize] = None
         self.path: Optional[str] = None
-        self.ratio_from_old = 1
         self.ratio_to_src = 1
 
+        # init preview, shown while the path opening is decoded, img stays None so that nothing can be labeled on it
+        self.opening: Optional[str] = None
+        self.preview_mat: Optional[numpy.ndarray] = None
+        self.preview: Optional[QImage] = None
+
+        # init scene, the image and the labels are items updated in place
+        self.scene = LabelScene(self)
+        self.img_view.setScene(self.scene)
+
+        # changes with every image, results of the auto labeler for an old image are dropped
+        self.img_id = 0
+
+        # init window, the press position with the window dragged from
+        self.window_drag: Optional[Tuple[QPoint, float, float]] = None
+
         # init pixel spacing
         self.pixel_spacing: Optional[Tuple[float, float]] = None
 
@@ -48,30 +85,86 @@ class LabelApp(QMainWindow, Ui_form):
         self.index_b: Optional[int] = None
         self.index_c: Optional[int] = None
 
-        # a: index_a - a, color
-        self.points: Dict[int, Tuple[QPointF, QColor]] = {}
-
-        # ab: index_a, index_b - color
-        self.lines: Dict[Tuple[int, int], QColor] = {}
+        # init points, lines, angles, circles and pivots
+        self.labels = AnnotationStore()
 
-        # ∠abc: index_a, index_b, index_c - color
-        self.angles: Dict[Tuple[int, int, int], QColor] = {}
+        # init spatial index for hit-testing, in source coordinates
+        self.spatial = SpatialIndex()
 
-        # ⊙a, r = ab: index_a, index_b - color
-        self.circles: Dict[Tuple[int, int], QColor] = {}
-
-        # init pivots
-        self.pivots: Set[int] = set()
-
-        # init highlight
+        # init highlight, lines and circles are highlighted on hover to be erased
         self.highlight_move_index: Optional[int] = None
+        self.highlight_move_line: Optional[Tuple[int, int]] = None
+        self.highlight_move_circle: Optional[Tuple[int, int]] = None
         self.highlight_points: Set[int] = set()
 
+        # init dirty parts, and the points, line and circle highlighted on the last refresh
+        self.dirty = Dirty()
+        self.highlighted: Set[int] = set()
+        self.highlighted_line: Optional[Tuple[int, int]] = None
+        self.highlighted_circle: Optional[Tuple[int, int]] = None
+
         # init right button menu
         self.right_btn_menu = QMenu(self)
 
-        # init image dir
+        # init image dir, and the image opened in it for the previous / next one
         self.dir: Optional[str] = None
+        self.img_path: Optional[str] = None
+
+        # init prefetcher, decoding the next images of the dir while this one is labeled
+        self.prefetcher = Prefetcher(config.prefetch_workers, config.prefetch_cache_bytes)
+        self.opener = ImageOpener(self.prefetcher, self)
+        self.opener.previewed.connect(self.on_img_previewed)
+        self.opener.opened.connect(self.on_img_opened)
+        self.opener.failed.connect(self.on_img_open_failed)
+
+        # init thumbnails of the images of the dir, loaded from the cache on disk or made off the GUI thread,
+        # the ones of the dir left are dropped
+        self.thumbnail_dir: Optional[str] = None
+        self.thumbnail_items: Dict[str, QListWidgetItem] = {}
+        self.thumbnail_generation = 0
+        self.thumbnail_loader = ThumbnailLoader(ThumbnailCache(), self)
+        self.thumbnail_loader.loaded.connect(self.on_thumbnail_loaded)
+        self.init_thumbnail_dock()
+
+        # init window state
+        self.window_state = QLabel()
+        self.status_bar.addPermanentWidget(self.window_state)
+
+        # init frame box for multi-frame DICOM, every frame has its own labels
+        self.frame_labels: Dict[int, AnnotationStore] = {}
+        self.frame_box = QSpinBox()
+        self.frame_box.setPrefix('帧：')
+        self.frame_box.setRange(1, 1)
+        self.frame_box.setKeyboardTracking(False)
+        self.frame_box.valueChanged.connect(self.switch_frame)
+        self.status_bar.addPermanentWidget(self.frame_box)
+        self.frame_box.hide()
+
+        # init model, warm it up once the window is shown
+        # auto_label_img: the image auto labeled once the model loading retried by auto_add_points is done
+        self.model_ready = False
+        self.auto_label_img: Optional[int] = None
+        self.model_state = QLabel()
+        self.status_bar.addPermanentWidget(self.model_state)
+        self.model_loader = ModelLoader(self)
+        self.model_loader.loaded.connect(self.on_model_loaded)
+        self.model_loader.failed.connect(self.on_model_failed)
+        QCoreApplication.instance().aboutToQuit.connect(self.stop_workers)
+        self.auto_add_pts_btn.setEnabled(False)
+        self.model_state.setText('模型：加载中')
+        QTimer.singleShot(0, self.model_loader.start)
+
+        # init auto labeler
+        self.auto_labeler: Optional[AutoLabeler] = None
+        self.auto_label_progress = QProgressBar()
+        self.auto_label_progress.setMaximumWidth(200)
+        self.auto_label_progress.setFormat('自动判断：%p%')
+        self.status_bar.addPermanentWidget(self.auto_label_progress)
+        self.cancel_auto_label_btn = QPushButton('取消')
+        self.cancel_auto_label_btn.clicked.connect(self.cancel_auto_label)
+        self.status_bar.addPermanentWidget(self.cancel_auto_label_btn)
+        self.auto_label_progress.hide()
+        self.cancel_auto_label_btn.hide()
 
     def init_color_box(self):
         size = self.color_box.iconSize()
@@ -96,9 +189,27 @@ class LabelApp(QMainWindow, Ui_form):
             index += 1
         self.action_box.setCurrentIndex(default_index)
 
+    def init_thumbnail_dock(self):
+        self.thumbnail_list = QListWidget()
+        self.thumbnail_list.setViewMode(QListView.IconMode)
+        self.thumbnail_list.setFlow(QListView.LeftToRight)
+        self.thumbnail_list.setWrapping(False)
+        self.thumbnail_list.setMovement(QListView.Static)
+        self.thumbnail_list.setUniformItemSizes(True)
+        self.thumbnail_list.setIconSize(QSize(config.thumbnail_size, config.thumbnail_size))
+        self.thumbnail_list.setFixedHeight(config.thumbnail_size + 48)
+        self.thumbnail_list.itemClicked.connect(self.on_thumbnail_clicked)
+        self.thumbnail_dock = QDockWidget('缩略图', self)
+        self.thumbnail_dock.setObjectName('thumbnail_dock')
+        self.thumbnail_dock.setWidget(self.thumbnail_list)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.thumbnail_dock)
+        self.menu.insertAction(self.delete_img_btn, self.thumbnail_dock.toggleViewAction())
+
     def init_event_connections(self):
         self.img_view.viewport().installEventFilter(self)
         self.load_img_btn.triggered.connect(self.upload_img)
+        self.prev_img_btn.triggered.connect(self.prev_img)
+        self.next_img_btn.triggered.connect(self.next_img)
         self.delete_img_btn.triggered.connect(self.delete_img)
         self.save_img_btn.triggered.connect(self.save_img)
         self.import_btn.triggered.connect(self.import_labels)
@@ -115,11 +226,22 @@ class LabelApp(QMainWindow, Ui_form):
         self.auto_add_pts_btn.triggered.connect(self.auto_add_points)
 
     def reset_img(self):
+        self.mat = None
         self.src = None
+        self.voi = None
+        self.window_drag = None
+        self.window_state.setText('')
+        self.frames = None
+        self.frame = 0
+        self.frame_labels = {}
+        self.frame_box.hide()
         self.img = None
         self.path = None
-        self.ratio_from_old = 1
         self.ratio_to_src = 1
+        self.opening = None
+        self.preview_mat = None
+        self.preview = None
+        self.img_id += 1
         self.pixel_spacing = None
         self.patient_info.setMarkdown('')
 
@@ -130,16 +252,16 @@ class LabelApp(QMainWindow, Ui_form):
 
     def reset_highlight(self):
         self.highlight_move_index = None
+        self.highlight_move_line = None
+        self.highlight_move_circle = None
         self.highlight_points.clear()
 
     def reset_except_img(self):
         self.reset_index()
-        self.points.clear()
-        self.lines.clear()
-        self.angles.clear()
-        self.circles.clear()
-        self.pivots.clear()
+        self.labels.clear()
         self.reset_highlight()
+        self.dirty.mark_labels()
+        self.dirty.mark_pivots()
 
     def reset_all(self):
         self.reset_img()
@@ -147,199 +269,326 @@ class LabelApp(QMainWindow, Ui_form):
 
     def update_img(self):
         if not self.src:
-            self.reset_img()
+            if not self.opening:
+                self.reset_img()
             return None
-        old = self.img if self.img else self.src
-        size = QSize(
-            (self.img_view.width() - 2 * self.img_view.lineWidth()) * self.img_size,
-            (self.img_view.height() - 2 * self.img_view.lineWidth()) * self.img_size
-        )
-        self.img = self.src.scaled(size, Qt.KeepAspectRatio)
-        self.ratio_from_old = self.img.width() / old.width()
+        self.img = self.get_img_size(self.src)
         self.ratio_to_src = self.src.width() / self.img.width()
 
-    def update_points(self):
-        if not self.img or not self.points or self.ratio_from_old == 1:
-            return None
-        for point, _ in self.points.values():
-            point.setX(point.x() * self.ratio_from_old)
-            point.setY(point.y() * self.ratio_from_old)
-        self.ratio_from_old = 1
-
-    def get_src_point(self, point: QPointF):
-        return QPointF(point.x() * self.ratio_to_src, point.y() * self.ratio_to_src)
-
-    def get_img_point(self, point: QPointF):
-        return QPointF(point.x() / self.ratio_to_src, point.y() / self.ratio_to_src)
+    # the box the image is fitted in
+    def get_view_size(self):
+        return QSize(
+            int((self.img_view.width() - 2 * self.img_view.lineWidth()) * self.img_size),
+            int((self.img_view.height() - 2 * self.img_view.lineWidth()) * self.img_size)
+        )
 
-    def label_points(self, img: Optional[QPixmap], to_src: bool):
-        if not img or not self.points:
+    def get_img_size(self, src: QImage):
+        return src.size().scaled(self.get_view_size(), Qt.KeepAspectRatio)
+
+    def is_point_highlight(self, index: int):
+        return index == self.highlight_move_index or index in self.highlight_points
+
+    def is_line_highlight(self, index_a: int, index_b: int):
+        return (index_a, index_b) == self.highlight_move_line \
+               or index_a in self.highlight_points and index_b in self.highlight_points \
+               and (self.mode == LabelMode.ANGLE_MODE or self.mode == LabelMode.VERTICAL_MODE)
+
+    def is_circle_highlight(self, index_a: int, index_b: int):
+        return (index_a, index_b) == self.highlight_move_circle \
+               or index_a in self.highlight_points and index_b in self.highlight_points \
+               and self.mode == LabelMode.CIRCLE_MODE
+
+    # length of ab in mm, or in pixels of the source without pixel spacing
+    def get_distance_text(self, a: QPointF, b: QPointF):
+        real_a = a
+        real_b = b
+        if self.pixel_spacing:
+            real_a = QPointF(a.x() * self.pixel_spacing[0], a.y() * self.pixel_spacing[1])
+            real_b = QPointF(b.x() * self.pixel_spacing[0], b.y() * self.pixel_spacing[1])
+        return str(round(utils.get_distance(real_a, real_b), 2)) + ('mm' if self.pixel_spacing else 'px')
+
+    # the labels painted onto the source, as large as they are shown
+    def label_points(self, img: Optional[QImage]):
+        if not img or not self.labels.points:
             return None
         painter = QPainter()
         painter.begin(img)
         painter.setRenderHint(QPainter.Antialiasing, True)
         pen = QPen()
         pen.setCapStyle(Qt.RoundCap)
-        pen.setWidthF(config.point_width * (self.ratio_to_src if to_src else 1))
+        pen.setWidthF(config.point_width * self.ratio_to_src)
         font = QFont('Consolas')
-        font.setPointSizeF(config.font_size * (self.ratio_to_src if to_src else 1))
+        font.setPointSizeF(config.font_size * self.ratio_to_src)
         painter.setFont(font)
-        for index, (point, color) in self.points.items():
-            if to_src:
-                pen.setColor(color)
-                label_point = self.get_src_point(point)
-            else:
-                pen.setColor(
-                    color if index != self.highlight_move_index and index not in self.highlight_points
-                    else QColor.lighter(color)
-                )
-                label_point = point
+        for index, (point, color) in self.labels.points.items():
+            pen.setColor(color)
             painter.setPen(pen)
-            painter.drawPoint(label_point)
-            painter.drawText(utils.get_index_shift(label_point), str(index))
+            painter.drawPoint(point)
+            painter.drawText(utils.get_index_shift(point), str(index))
         painter.end()
 
-    def label_lines(self, img: Optional[QPixmap], to_src: bool):
-        if not img or not self.lines:
+    def label_lines(self, img: Optional[QImage]):
+        if not img or not self.labels.lines:
             return None
         painter = QPainter()
         painter.begin(img)
         painter.setRenderHint(QPainter.Antialiasing, True)
         pen = QPen()
         pen.setCapStyle(Qt.RoundCap)
-        pen.setWidthF(config.line_width * (self.ratio_to_src if to_src else 1))
+        pen.setWidthF(config.line_width * self.ratio_to_src)
         font = QFont('Consolas')
-        font.setPointSizeF(config.font_size * (self.ratio_to_src if to_src else 1))
+        font.setPointSizeF(config.font_size * self.ratio_to_src)
         painter.setFont(font)
-        for (index_a, index_b), color in self.lines.items():
-            is_highlight = index_a in self.highlight_points and index_b in self.highlight_points \
-                          and (self.mode == LabelMode.ANGLE_MODE or self.mode == LabelMode.VERTICAL_MODE)
-            pen.setColor(QColor.lighter(color) if is_highlight else color)
+        for (index_a, index_b), color in self.labels.lines.items():
+            pen.setColor(QColor.lighter(color) if self.is_line_highlight(index_a, index_b) else color)
             painter.setPen(pen)
-            a = self.points[index_a][0]
-            b = self.points[index_b][0]
-            src_a = self.get_src_point(a)
-            src_b = self.get_src_point(b)
-            label_a = src_a if to_src else a
-            label_b = src_b if to_src else b
-            painter.drawLine(label_a, label_b)
-            real_a = src_a
-            real_b = src_b
-            if self.pixel_spacing:
-                real_a = QPointF(src_a.x() * self.pixel_spacing[0], src_a.y() * self.pixel_spacing[1])
-                real_b = QPointF(src_b.x() * self.pixel_spacing[0], src_b.y() * self.pixel_spacing[1])
-            painter.drawText(
-                utils.get_distance_shift(a, b, utils.get_midpoint(label_a, label_b)),
-                str(round(utils.get_distance(real_a, real_b), 2)) + ('mm' if self.pixel_spacing else 'px')
-            )
+            a = self.labels.points[index_a][0]
+            b = self.labels.points[index_b][0]
+            painter.drawLine(a, b)
+            painter.drawText(utils.get_distance_shift(a, b, utils.get_midpoint(a, b)), self.get_distance_text(a, b))
         painter.end()
 
-    def label_angles(self, img: Optional[QPixmap], to_src: bool):
-        if not img or not self.angles:
+    def label_angles(self, img: Optional[QImage]):
+        if not img or not self.labels.angles:
             return None
         painter = QPainter()
         painter.begin(img)
         painter.setRenderHint(QPainter.Antialiasing, True)
         pen = QPen()
         pen.setCapStyle(Qt.RoundCap)
-        pen.setWidthF(config.angle_width * (self.ratio_to_src if to_src else 1))
+        pen.setWidthF(config.angle_width * self.ratio_to_src)
         font = QFont('Consolas')
-        font.setPointSizeF(config.font_size * (self.ratio_to_src if to_src else 1))
+        font.setPointSizeF(config.font_size * self.ratio_to_src)
         painter.setFont(font)
-        for (index_a, index_b, index_c), color in self.angles.items():
+        for (index_a, index_b, index_c), color in self.labels.angles.items():
             pen.setColor(color)
             painter.setPen(pen)
-            a = self.points[index_a][0]
-            b = self.points[index_b][0]
-            c = self.points[index_c][0]
-            d, e = utils.get_diag_points(self.points[index_a][0], b, c)
+            a = self.labels.points[index_a][0]
+            b = self.labels.points[index_b][0]
+            c = self.labels.points[index_c][0]
+            d, e = utils.get_diag_points(a, b, c)
             f = utils.get_arc_midpoint(a, b, c)
-            label_d = self.get_src_point(d) if to_src else d
-            label_e = self.get_src_point(e) if to_src else e
-            label_rect = QRectF(label_d, label_e)
-            label_a = self.get_src_point(b) if to_src else b
-            label_b = self.get_src_point(f) if to_src else f
             deg = utils.get_degree(a, b, c)
-            painter.drawArc(label_rect, int(utils.get_begin_degree(a, b, c) * 16), int(deg * 16))
-            painter.drawText(utils.get_degree_shift(label_a, label_b), str(round(deg, 2)) + '°')
+            painter.drawArc(QRectF(d, e), int(utils.get_begin_degree(a, b, c) * 16), int(deg * 16))
+            painter.drawText(utils.get_degree_shift(b, f), get_degree_text(deg))
         painter.end()
 
-    def label_circles(self, img: Optional[QPixmap], to_src: bool):
-        if not img or not self.circles:
+    def label_circles(self, img: Optional[QImage]):
+        if not img or not self.labels.circles:
             return None
         painter = QPainter()
         painter.begin(img)
         painter.setRenderHint(QPainter.Antialiasing, True)
         pen = QPen()
         pen.setCapStyle(Qt.RoundCap)
-        pen.setWidthF(config.line_width if not to_src else config.line_width * self.ratio_to_src)
-        for (index_a, index_b), color in self.circles.items():
-            is_highlight = index_a in self.highlight_points and index_b in self.highlight_points \
-                          and self.mode == LabelMode.CIRCLE_MODE
-            pen.setColor(QColor.lighter(color) if is_highlight else color)
+        pen.setWidthF(config.line_width * self.ratio_to_src)
+        for (index_a, index_b), color in self.labels.circles.items():
+            pen.setColor(QColor.lighter(color) if self.is_circle_highlight(index_a, index_b) else color)
             painter.setPen(pen)
-            a = self.points[index_a][0]
-            b = self.points[index_b][0]
             painter.drawEllipse(
-                utils.get_min_bounding_rect(a, b) if not to_src
-                else utils.get_min_bounding_rect(self.get_src_point(a), self.get_src_point(b))
+                utils.get_min_bounding_rect(self.labels.points[index_a][0], self.labels.points[index_b][0])
             )
         painter.end()
 
-    def update_labels(self, img: Optional[QPixmap], to_src: bool):
-        self.label_points(img, to_src)
-        self.label_lines(img, to_src)
-        self.label_angles(img, to_src)
-        self.label_circles(img, to_src)
+    def update_labels(self, img: Optional[QImage]):
+        self.label_points(img)
+        self.label_lines(img)
+        self.label_angles(img)
+        self.label_circles(img)
+
+    def update_point_items(self, indexs: Iterable[int]):
+        for index in indexs:
+            point, color = self.labels.points[index]
+            item = self.scene.get_point(index)
+            item.set_point(point, index)
+            item.set_color(QColor.lighter(color) if self.is_point_highlight(index) else color)
+
+    def update_line_items(self, keys: Iterable[Tuple[int, int]]):
+        for index_a, index_b in keys:
+            color = self.labels.lines[index_a, index_b]
+            a = self.labels.points[index_a][0]
+            b = self.labels.points[index_b][0]
+            item = self.scene.get_line((index_a, index_b))
+            item.set_line(
+                a, b, utils.get_midpoint(a, b), utils.get_distance_shift(a, b, QPointF()), self.get_distance_text(a, b)
+            )
+            item.set_color(QColor.lighter(color) if self.is_line_highlight(index_a, index_b) else color)
+
+    def update_angle_items(self, keys: Iterable[Tuple[int, int, int]]):
+        for index_a, index_b, index_c in keys:
+            color = self.labels.angles[index_a, index_b, index_c]
+            a = self.labels.points[index_a][0]
+            b = self.labels.points[index_b][0]
+            c = self.labels.points[index_c][0]
+            d, e = utils.get_diag_points(a, b, c)
+            f = utils.get_arc_midpoint(a, b, c)
+            deg = utils.get_degree(a, b, c)
+            item = self.scene.get_angle((index_a, index_b, index_c))
+            item.set_arc(
+                QRectF(d, e), int(utils.get_begin_degree(a, b, c) * 16), int(deg * 16),
+                f, utils.get_degree_shift(b, f) - f, get_degree_text(deg)
+            )
+            item.set_color(color)
+
+    def update_circle_items(self, keys: Iterable[Tuple[int, int]]):
+        for index_a, index_b in keys:
+            color = self.labels.circles[index_a, index_b]
+            item = self.scene.get_circle((index_a, index_b))
+            item.set_rect(utils.get_min_bounding_rect(self.labels.points[index_a][0], self.labels.points[index_b][0]))
+            item.set_color(QColor.lighter(color) if self.is_circle_highlight(index_a, index_b) else color)
 
+    def update_items(self):
+        if not self.img:
+            self.scene.clear_labels()
+            return None
+        self.scene.retain(self.labels.points, self.labels.lines, self.labels.angles, self.labels.circles)
+        self.update_point_items(self.labels.points)
+        self.update_line_items(self.labels.lines)
+        self.update_angle_items(self.labels.angles)
+        self.update_circle_items(self.labels.circles)
+
+    # the points and the lines, angles and circles on them
+    def update_items_of(self, indexs: Set[int]):
+        if not self.img:
+            return None
+        self.update_point_items([index for index in indexs if index in self.labels.points])
+        self.update_line_items(self.labels.get_lines_of(indexs))
+        self.update_angle_items(self.labels.get_angles_of(indexs))
+        self.update_circle_items(self.labels.get_circles_of(indexs))
+
+    # lines and circles recolored, the ones erased meanwhile are gone from the scene already
+    def update_hover_items(self, lines: Set[Tuple[int, int]], circles: Set[Tuple[int, int]]):
+        if not self.img:
+            return None
+        self.update_line_items([key for key in lines if key in self.labels.lines])
+        self.update_circle_items([key for key in circles if key in self.labels.circles])
+
+    # zoom is a transform of the view, the scene stays in source coordinates
     def update_img_view(self):
-        scene = QGraphicsScene()
-        if self.img:
-            scene.addPixmap(self.img)
-        self.img_view.setScene(scene)
+        if not self.src and self.preview:
+            zoom = self.get_img_size(self.preview).width() / self.preview.width()
+            self.img_view.setTransform(QTransform.fromScale(zoom, zoom))
+            self.scene.set_img(self.preview, zoom)
+            return None
+        zoom = 1 / self.ratio_to_src
+        self.img_view.setTransform(QTransform.fromScale(zoom, zoom))
+        self.scene.set_img(self.src, zoom, self.voi)
 
     def update_pivots_info(self):
-        if not self.img or not self.points or not self.pivots:
+        if not self.img or not self.labels.points or not self.labels.pivots:
             self.pivots_info.setMarkdown('')
             return None
-        pivots = list(self.pivots)
+        pivots = list(self.labels.pivots)
         pivots.sort()
         md_info = ''
         for index in pivots:
-            point = self.get_src_point(self.points[index][0])
+            point = self.labels.points[index][0]
             md_info += f'{index}: ({round(point.x(), 2)}, {round(point.y(), 2)})\n\n'
         self.pivots_info.setMarkdown(md_info)
 
+    def get_highlighted(self):
+        highlighted = set(self.highlight_points)
+        if self.highlight_move_index:
+            highlighted.add(self.highlight_move_index)
+        return highlighted
+
+    # a full rebuild, for a new image, frame or set of labels
+    def update_spatial(self):
+        self.spatial.clear()
+        for index, (point, _) in self.labels.points.items():
+            self.spatial.set_point(index, point)
+        for index_a, index_b in self.labels.lines:
+            self.spatial.set_line((index_a, index_b), self.labels.points[index_a][0], self.labels.points[index_b][0])
+        for index_a, index_b in self.labels.circles:
+            self.spatial.set_circle((index_a, index_b), self.labels.points[index_a][0], self.labels.points[index_b][0])
+
+    # the points, and the lines and circles on them
+    def update_spatial_of(self, indexs: Set[int]):
+        for index in indexs:
+            if index in self.labels.points:
+                self.spatial.set_point(index, self.labels.points[index][0])
+        for index_a, index_b in self.labels.get_lines_of(indexs):
+            self.spatial.set_line((index_a, index_b), self.labels.points[index_a][0], self.labels.points[index_b][0])
+        for index_a, index_b in self.labels.get_circles_of(indexs):
+            self.spatial.set_circle((index_a, index_b), self.labels.points[index_a][0], self.labels.points[index_b][0])
+
+    def remove_spatial_of(self, erased: Erased):
+        for index in erased.points:
+            self.spatial.remove_point(index)
+        for key in erased.lines:
+            self.spatial.remove_line(key)
+        for key in erased.circles:
+            self.spatial.remove_circle(key)
+
+    # recompute the dirty parts only
+    def refresh(self):
+        dirty = self.dirty
+        highlighted = self.get_highlighted()
+        if highlighted != self.highlighted:
+            dirty.mark_points(*(highlighted ^ self.highlighted))
+            self.highlighted = highlighted
+        # the hover may move between a line and a circle on the same points
+        if self.highlight_move_line != self.highlighted_line:
+            dirty.mark_lines(*(key for key in (self.highlighted_line, self.highlight_move_line) if key))
+            self.highlighted_line = self.highlight_move_line
+        if self.highlight_move_circle != self.highlighted_circle:
+            dirty.mark_circles(*(key for key in (self.highlighted_circle, self.highlight_move_circle) if key))
+            self.highlighted_circle = self.highlight_move_circle
+        if not dirty.is_dirty():
+            return None
+        if dirty.img:
+            self.update_img()
+            self.update_img_view()
+        if dirty.pixels:
+            self.scene.update_pixels()
+            self.update_window_state()
+        if dirty.labels:
+            self.update_spatial()
+            self.update_items()
+        else:
+            if not dirty.erased.is_empty():
+                self.scene.remove_erased(dirty.erased)
+                self.remove_spatial_of(dirty.erased)
+            if dirty.points:
+                self.update_spatial_of(dirty.points)
+                self.update_items_of(dirty.points)
+            self.update_hover_items(dirty.lines, dirty.circles)
+        if dirty.pivots or not self.labels.pivots.isdisjoint(dirty.points):
+            self.update_pivots_info()
+        dirty.clear()
+
     def update_all(self):
-        self.update_img()
-        self.update_points()
-        self.update_labels(self.img, False)
-        self.update_img_view()
-        self.update_pivots_info()
+        self.dirty.mark_img()
+        self.refresh()
 
     def resizeEvent(self, _: QResizeEvent):
         self.update_all()
 
     def get_point_index(self, point: QPointF):
-        if not self.img or not self.points:
-            return None
-        distance = config.point_width - config.eps
-        index = None
-        for idx, (pt, _) in self.points.items():
-            if (dis := utils.get_distance(point, pt)) < distance:
-                distance = dis
-                index = idx
-        return index
+        if not self.img or not self.labels.points:
+            return None
+        return self.spatial.get_point_index(point, (config.point_width - config.eps) * self.ratio_to_src)
+
+    def get_line_index(self, point: QPointF):
+        if not self.img or not self.labels.lines:
+            return None
+        return self.spatial.get_line_key(point, config.point_width * self.ratio_to_src)
+
+    def get_circle_index(self, point: QPointF):
+        if not self.img or not self.labels.circles:
+            return None
+        return self.spatial.get_circle_key(point, config.point_width * self.ratio_to_src)
 
     def is_point_out_of_bound(self, point: QPointF):
-        return point.x() < config.point_width / 2 or point.x() > self.img.width() - config.point_width / 2 \
-               or point.y() < config.point_width / 2 or point.y() > self.img.height() - config.point_width / 2
+        margin = config.point_width / 2 * self.ratio_to_src
+        return point.x() < margin or point.x() > self.src.width() - margin \
+               or point.y() < margin or point.y() > self.src.height() - margin
 
     def get_index_cnt(self):
         return len([i for i in (self.index_a, self.index_b, self.index_c) if i])
 
     def trigger_index(self, index: int):
-        if not self.img or not self.points or not index:
+        if not self.img or not self.labels.points or not index:
             return None
         if index in (self.index_a, self.index_b, self.index_c):
             indexs = [i for i in (self.index_a, self.index_b, self.index_c) if i != index]
@@ -366,41 +615,47 @@ class LabelApp(QMainWindow, Ui_form):
         self.highlight_move_index = index
 
     def get_new_index(self):
-        return max(self.points.keys() if self.points else [0]) + 1
+        return self.labels.get_new_index()
 
     def add_new_point(self, point: QPointF):
         if self.img:
             index = self.get_new_index()
-            self.points[index] = point, self.color
+            self.labels.set_point(index, point, self.color)
+            self.dirty.mark_points(index)
             return index
 
     def add_line(self, index_a: int, index_b: int):
-        if self.img and index_a in self.points and index_b in self.points:
-            self.lines[utils.get_line_key(index_a, index_b)] = self.color
+        if self.img and index_a in self.labels.points and index_b in self.labels.points:
+            self.labels.add_line(index_a, index_b, self.color)
+            self.dirty.mark_points(index_a, index_b)
 
     def add_angle(self, index_a: int, index_b: int, index_c: int):
-        if self.img and utils.get_line_key(index_a, index_b) in self.lines \
-                and utils.get_line_key(index_b, index_c) in self.lines:
-            self.angles[utils.get_angle_key(index_a, index_b, index_c)] = self.color
+        if self.img and utils.get_line_key(index_a, index_b) in self.labels.lines \
+                and utils.get_line_key(index_b, index_c) in self.labels.lines:
+            self.labels.add_angle(index_a, index_b, index_c, self.color)
+            self.dirty.mark_points(index_a, index_b, index_c)
 
     def add_circle(self, index_a: int, index_b: int):
-        if self.img and index_a in self.points and index_b in self.points:
-            self.circles[(index_a, index_b)] = self.color
+        if self.img and index_a in self.labels.points and index_b in self.labels.points:
+            self.labels.add_circle(index_a, index_b, self.color)
+            self.dirty.mark_points(index_a, index_b)
 
     def erase_point(self, index: int):
-        if index not in self.points:
-            return None
-        self.points.pop(index)
-        for line in list(self.lines.keys()):
-            if index in line:
-                self.lines.pop(line)
-        for angle in list(self.angles.keys()):
-            if index in angle:
-                self.angles.pop(angle)
-        for circle in list(self.circles.keys()):
-            if index in circle:
-                self.circles.pop(circle)
-        self.pivots.discard(index)
+        if index not in self.labels.points:
+            return None
+        self.dirty.mark_erased(self.labels.erase_point(index))
+        self.dirty.mark_pivots()
+
+    # with the angles on it
+    def erase_line(self, key: Tuple[int, int]):
+        if key not in self.labels.lines:
+            return None
+        self.dirty.mark_erased(self.labels.erase_line(key))
+
+    def erase_circle(self, key: Tuple[int, int]):
+        if key not in self.labels.circles:
+            return None
+        self.dirty.mark_erased(self.labels.erase_circle(key))
 
     def erase_highlight(self):
         for index in (self.index_a, self.index_b, self.index_c):
@@ -408,17 +663,18 @@ class LabelApp(QMainWindow, Ui_form):
                 self.erase_point(-index)
         self.reset_index()
         self.reset_highlight()
-        self.update_all()
+        self.refresh()
 
     def handle_point_mode(self, evt: QMouseEvent):
         if evt.type() != QMouseEvent.MouseButtonPress or evt.button() != Qt.LeftButton:
             return None
         point = self.img_view.mapToScene(evt.pos())
         if index := self.get_point_index(point):
-            self.points[index] = self.points[index][0], self.color
+            self.labels.set_point(index, self.labels.points[index][0], self.color)
+            self.dirty.mark_points(index)
         else:
             self.add_new_point(point)
-        self.update_all()
+        self.refresh()
 
     def handle_line_mode(self, evt: QMouseEvent):
         if evt.type() != QMouseEvent.MouseButtonPress or evt.button() != Qt.LeftButton:
@@ -431,23 +687,23 @@ class LabelApp(QMainWindow, Ui_form):
             index_b = abs(self.index_b)
             self.add_line(index_a, index_b)
             self.end_trigger_with(index_b)
-        self.update_all()
+        self.refresh()
 
     def handle_angle_mode(self, evt: QMouseEvent):
         if evt.type() != QMouseEvent.MouseButtonPress or evt.button() != Qt.LeftButton:
             return None
         self.trigger_index(self.get_point_index(self.img_view.mapToScene(evt.pos())))
-        if self.get_index_cnt() == 2 and utils.get_line_key(self.index_a, self.index_b) not in self.lines:
+        if self.get_index_cnt() == 2 and utils.get_line_key(self.index_a, self.index_b) not in self.labels.lines:
             self.trigger_index(self.index_a)
         elif self.get_index_cnt() == 3:
-            if utils.get_line_key(self.index_b, self.index_c) in self.lines:
+            if utils.get_line_key(self.index_b, self.index_c) in self.labels.lines:
                 self.add_angle(self.index_a, self.index_b, self.index_c)
                 self.end_trigger_with(self.index_c)
             else:
                 index_c = self.index_c
                 self.end_trigger()
                 self.trigger_index(index_c)
-        self.update_all()
+        self.refresh()
 
     def handle_circle_mode(self, evt: QMouseEvent):
         point = self.img_view.mapToScene(evt.pos())
@@ -464,37 +720,38 @@ class LabelApp(QMainWindow, Ui_form):
         elif evt.type() == QMouseEvent.MouseMove and self.get_index_cnt() == 2 \
                 and not self.is_point_out_of_bound(point):
             index_b = abs(self.index_b)
-            self.points[index_b][0].setX(point.x())
-            self.points[index_b][0].setY(point.y())
-        self.update_all()
+            self.labels.points[index_b][0].setX(point.x())
+            self.labels.points[index_b][0].setY(point.y())
+            self.dirty.mark_points(index_b)
+        self.refresh()
 
     def handle_midpoint_mode(self, evt: QMouseEvent):
         if evt.type() != QMouseEvent.MouseButtonPress or evt.button() != Qt.LeftButton:
             return None
         self.trigger_index(self.get_point_index(self.img_view.mapToScene(evt.pos())))
         if self.get_index_cnt() == 2:
-            if utils.get_line_key(self.index_a, self.index_b) in self.lines:
-                a = self.points[self.index_a][0]
-                b = self.points[self.index_b][0]
+            if utils.get_line_key(self.index_a, self.index_b) in self.labels.lines:
+                a = self.labels.points[self.index_a][0]
+                b = self.labels.points[self.index_b][0]
                 self.add_new_point(utils.get_midpoint(a, b))
                 self.end_trigger_with(self.index_b)
             else:
                 self.trigger_index(self.index_a)
-        self.update_all()
+        self.refresh()
 
     def handle_vertical_mode(self, evt: QMouseEvent):
         if evt.type() != QMouseEvent.MouseButtonPress or evt.button() != Qt.LeftButton:
             return None
         self.trigger_index(self.get_point_index(self.img_view.mapToScene(evt.pos())))
         if self.get_index_cnt() == 2:
-            if utils.get_line_key(self.index_a, self.index_b) not in self.lines:
+            if utils.get_line_key(self.index_a, self.index_b) not in self.labels.lines:
                 self.trigger_index(self.index_a)
         elif self.get_index_cnt() == 3:
-            a = self.points[self.index_a][0]
-            b = self.points[self.index_b][0]
-            c = self.points[self.index_c][0]
+            a = self.labels.points[self.index_a][0]
+            b = self.labels.points[self.index_b][0]
+            c = self.labels.points[self.index_c][0]
             if utils.is_on_a_line(a, b, c):
-                if utils.get_line_key(self.index_b, self.index_c) in self.lines:
+                if utils.get_line_key(self.index_b, self.index_c) in self.labels.lines:
                     self.trigger_index(self.index_a)
                 else:
                     index_c = self.index_c
@@ -510,7 +767,7 @@ class LabelApp(QMainWindow, Ui_form):
                     )
                 self.add_line(self.index_c, index_d)
                 self.end_trigger_with(self.index_c)
-            self.update_all()
+            self.refresh()
 
     def handle_drag_mode(self, evt: QMouseEvent):
         point = self.img_view.mapToScene(evt.pos())
@@ -518,24 +775,60 @@ class LabelApp(QMainWindow, Ui_form):
             self.trigger_index(self.get_point_index(point))
         elif evt.type() == QMouseEvent.MouseMove and self.get_index_cnt() == 1 \
                 and not self.is_point_out_of_bound(point):
-            self.points[self.index_a][0].setX(point.x())
-            self.points[self.index_a][0].setY(point.y())
+            self.labels.points[self.index_a][0].setX(point.x())
+            self.labels.points[self.index_a][0].setY(point.y())
+            self.dirty.mark_points(self.index_a)
         elif evt.type() == QMouseEvent.MouseButtonRelease and self.get_index_cnt() == 1:
             self.trigger_index(self.index_a)
-        self.update_all()
+        self.refresh()
 
+    # a point, or else a line or a circle under the cursor
     def handle_erase_point_mode(self, evt: QMouseEvent):
         if evt.type() == QMouseEvent.MouseButtonPress and evt.button() == Qt.LeftButton:
-            self.erase_point(self.get_point_index(self.img_view.mapToScene(evt.pos())))
-        self.update_all()
+            point = self.img_view.mapToScene(evt.pos())
+            if index := self.get_point_index(point):
+                self.erase_point(index)
+            elif line := self.get_line_index(point):
+                self.erase_line(line)
+            elif circle := self.get_circle_index(point):
+                self.erase_circle(circle)
+        self.refresh()
+
+    # drag right / left to widen / narrow the window, down / up to raise / lower its center, right click to reset it
+    def handle_window_mode(self, evt: QMouseEvent):
+        if not self.voi:
+            return None
+        if evt.type() == QMouseEvent.MouseButtonPress and evt.button() == Qt.LeftButton:
+            self.window_drag = evt.pos(), self.voi.center, self.voi.width
+        elif evt.type() == QMouseEvent.MouseMove and self.window_drag and evt.buttons() & Qt.LeftButton:
+            pos, center, width = self.window_drag
+            step = self.voi.get_span() / config.window_drag_range
+            if self.voi.set_window(center + (evt.y() - pos.y()) * step, width + (evt.x() - pos.x()) * step):
+                self.dirty.mark_pixels()
+        elif evt.type() == QMouseEvent.MouseButtonRelease and evt.button() == Qt.LeftButton:
+            self.window_drag = None
+        elif evt.type() == QMouseEvent.MouseButtonPress and evt.button() == Qt.RightButton \
+                and not self.get_point_index(self.img_view.mapToScene(evt.pos())):
+            if self.voi.reset():
+                self.dirty.mark_pixels()
+        self.refresh()
+
+    def update_window_state(self):
+        if self.voi:
+            self.window_state.setText(f'窗位：{round(self.voi.center, 2)} 窗宽：{round(self.voi.width, 2)}')
 
     def handle_highlight_move(self, evt: QMouseEvent):
         point = self.img_view.mapToScene(evt.pos())
         self.highlight_move_index = self.get_point_index(point)
-        point = self.get_src_point(point)
+        self.highlight_move_line = None
+        self.highlight_move_circle = None
+        if self.mode == LabelMode.ERASE_POINT_MODE and not self.highlight_move_index:
+            self.highlight_move_line = self.get_line_index(point)
+            if not self.highlight_move_line:
+                self.highlight_move_circle = self.get_circle_index(point)
         text = f'坐标：{round(point.x(), 2)}, {round(point.y(), 2)}'
         self.status_bar.showMessage(text, 1000)
-        self.update_all()
+        self.refresh()
 
     def modify_index(self, index: int):
         new_index, modify = QInputDialog.getInt(self, '更改标号', '请输入一个新的标号', index, 0, step=1)
@@ -544,50 +837,35 @@ class LabelApp(QMainWindow, Ui_form):
         if new_index <= 0:
             self.warning('标号必须为正整数！')
             return None
-        if new_index in self.points:
+        if new_index in self.labels.points:
             self.warning('此标号已存在！')
             return None
-        self.points[new_index] = self.points[index]
-        self.points.pop(index)
-        for line in list(self.lines.keys()):
-            if index in line:
-                fixed_index = line[0] + line[1] - index
-                self.lines[utils.get_line_key(new_index, fixed_index)] = self.lines[line]
-                self.lines.pop(line)
-        for angle in list(self.angles.keys()):
-            if index in angle:
-                if index == angle[1]:
-                    self.angles[angle[0], new_index, angle[2]] = self.angles[angle]
-                else:
-                    fixed_index = angle[0] + angle[2] - index
-                    self.angles[utils.get_angle_key(new_index, angle[1], fixed_index)] = self.angles[angle]
-                self.angles.pop(angle)
-        for circle in list(self.circles.keys()):
-            if index in circle:
-                key = (new_index, circle[1]) if index == circle[0] else (circle[0], new_index)
-                self.circles[key] = self.circles[circle]
-                self.circles.pop(circle)
-        if index in self.pivots:
-            self.pivots.remove(index)
-            self.pivots.add(new_index)
+        # the shapes are drawn again on the new index
+        self.dirty.mark_erased(self.labels.rename_point(index, new_index))
+        self.dirty.mark_points(new_index)
+        self.dirty.mark_pivots()
 
     def add_pivots(self, index: int):
-        if self.img and index in self.points:
-            self.pivots.add(index)
+        if self.img and index in self.labels.points:
+            self.labels.pivots.add(index)
+            self.dirty.mark_pivots()
 
     def remove_pivots(self, index: int):
-        if self.img and self.pivots:
-            self.pivots.discard(index)
+        if self.img and self.labels.pivots:
+            self.labels.pivots.discard(index)
+            self.dirty.mark_pivots()
 
     def switch_pivot_state(self, index: int):
-        self.remove_pivots(index) if index in self.pivots else self.add_pivots(index)
+        self.remove_pivots(index) if index in self.labels.pivots else self.add_pivots(index)
 
     def create_right_btn_menu(self, index: int, point: QPointF):
         self.right_btn_menu = QMenu(self)
         modify_index = QAction('更改标号', self.right_btn_menu)
         modify_index_triggered: pyqtBoundSignal = modify_index.triggered
         modify_index_triggered.connect(lambda: self.modify_index(index))
-        switch_pivot_state = QAction('删除该点信息' if index in self.pivots else '查看该点信息', self.right_btn_menu)
+        switch_pivot_state = QAction(
+            '删除该点信息' if index in self.labels.pivots else '查看该点信息', self.right_btn_menu
+        )
         switch_pivot_state_triggered: pyqtBoundSignal = switch_pivot_state.triggered
         switch_pivot_state_triggered.connect(lambda: self.switch_pivot_state(index))
         erase_point = QAction('清除该点', self.right_btn_menu)
@@ -602,13 +880,14 @@ class LabelApp(QMainWindow, Ui_form):
         if index := self.get_point_index(self.img_view.mapToScene(evt.pos())):
             self.erase_highlight()
             self.highlight_move_index = index
-            self.update_all()
+            self.refresh()
             global_pos = evt.globalPos()
             self.create_right_btn_menu(index, QPointF(float(global_pos.x()), float(global_pos.y())))
+            self.refresh()
             self.highlight_move_index = self.get_point_index(
                 self.img_view.mapToScene(self.img_view.mapFromParent(self.mapFromParent(QCursor.pos())))
             )
-            self.update_all()
+            self.refresh()
 
     def eventFilter(self, obj: QObject, evt: QEvent):
         if not self.img or obj is not self.img_view.viewport() or evt.type() not in self.target_event_type:
@@ -631,6 +910,8 @@ class LabelApp(QMainWindow, Ui_form):
             self.handle_drag_mode(evt)
         elif self.mode == LabelMode.ERASE_POINT_MODE:
             self.handle_erase_point_mode(evt)
+        elif self.mode == LabelMode.WINDOW_MODE:
+            self.handle_window_mode(evt)
         if evt.type() == QMouseEvent.MouseMove:
             self.handle_highlight_move(evt)
         elif evt.type() == QMouseEvent.MouseButtonPress and QMouseEvent(evt).button() == Qt.RightButton:
@@ -640,37 +921,186 @@ class LabelApp(QMainWindow, Ui_form):
     def warning(self, text: str):
         QMessageBox.warning(self, '警告', text)
 
-    # DICOM (*.dcm)
-    def load_dcm_img(self, path: str):
-        if utils.is_file_readable(path):
-            self.src, md_info, self.pixel_spacing = utils.get_dcm_img_with_info(path)
-            self.path = utils.rename_path_ext(path, '.jpg')
-            self.patient_info.setMarkdown(md_info)
-            self.update_all()
+    # DICOM (*.dcm), JPEG (*.jpg;*.jpeg;*.jpe), PNG (*.png), decoded off the GUI thread
+    def open_img(self, path: str):
+        if not utils.is_file_readable(path):
+            self.warning(
+                'Dicom 文件不存在或不可读！' if utils.is_dcm_path(path) else '图片文件不存在或不可读！'
+            )
+            return None
+        self.opening = path
+        self.status_bar.showMessage('打开中……')
+        # DICOM opened and prefetched from now on are windowed for the view as it is
+        size = self.get_view_size()
+        self.prefetcher.view_size = size.width(), size.height()
+        self.opener.open(self.img_id, path)
+
+    def on_img_previewed(self, img_id: int, mat: numpy.ndarray):
+        if img_id != self.img_id or not self.opening:
+            return None
+        self.preview_mat = mat
+        self.preview = utils.get_qimage(mat)
+        self.update_all()
+
+    def on_img_opened(self, img_id: int, path: str, decoded: DecodedImage):
+        if img_id != self.img_id or not self.opening:
+            return None
+        self.opening = None
+        self.preview_mat = None
+        self.preview = None
+        self.status_bar.clearMessage()
+        self.load_dcm_img(decoded) if decoded.frames else self.load_img(path, decoded)
+
+    def on_img_open_failed(self, img_id: int, err: str):
+        if img_id != self.img_id or not self.opening:
+            return None
+        self.opening = None
+        self.status_bar.clearMessage()
+        self.update_all()
+        self.warning(f'打开失败：{err}')
+
+    def load_dcm_img(self, decoded: DecodedImage):
+        self.frames = decoded.frames
+        self.frame_labels = {0: self.labels}
+        self.show_frame(0)
+        self.pixel_spacing = decoded.pixel_spacing
+        self.patient_info.setMarkdown(decoded.md_info)
+        if self.frames.count > 1:
+            self.frame_box.setValue(1)
+            self.frame_box.setRange(1, self.frames.count)
+            self.frame_box.setSuffix(f' / {self.frames.count}')
+            self.frame_box.show()
+        self.update_all()
+
+    # the window moved on a frame stays on the next one
+    def show_frame(self, index: int):
+        voi = self.frames.get_voi(index)
+        if self.voi:
+            voi.move(self.voi.center, self.voi.width)
         else:
-            self.warning('Dicom 文件不存在或不可读！')
-
-    # JPEG (*.jpg;*.jpeg;*.jpe), PNG (*.png)
-    def load_img(self, path: str):
-        if utils.is_file_readable(path):
-            self.src = QPixmap()
-            self.src.load(path)
-            self.path = path
-            self.update_all()
+            # a cached image is opened again at its own window
+            voi.reset()
+        self.voi = voi
+        self.frame = index
+        self.window_drag = None
+        self.mat = self.voi.mats[0]
+        self.src = utils.get_qimage(self.mat)
+        if self.frames.count > 1:
+            self.path = rename_frame_path(self.frames.path, index, '.jpg')
         else:
-            self.warning('图片文件不存在或不可读！')
+            self.path = utils.rename_path_ext(self.frames.path, '.jpg')
+        self.update_window_state()
+
+    # results of the auto labeler for the frame left are dropped
+    def switch_frame(self, value: int):
+        if not self.frames or value - 1 == self.frame:
+            return None
+        self.img_id += 1
+        self.reset_index()
+        self.reset_highlight()
+        self.labels = self.frame_labels.setdefault(value - 1, AnnotationStore())
+        self.show_frame(value - 1)
+        self.dirty.mark_labels()
+        self.dirty.mark_pivots()
+        self.update_all()
+
+    def load_img(self, path: str, decoded: DecodedImage):
+        self.mat = decoded.mat
+        self.src = utils.get_qimage(self.mat) if self.mat is not None else None
+        self.path = path
+        self.update_all()
 
     def upload_img(self):
         caption = '新建'
         init_dir = self.dir if self.dir else utils.get_home_img_dir()
         ext_filter = 'DICOM (*.dcm);;JPEG (*.jpg;*.jpeg;*.jpe);;PNG (*.png)'
         dcm_filter = 'DICOM (*.dcm)'
-        path, img_ext = QFileDialog.getOpenFileName(self, caption, init_dir, ext_filter, dcm_filter)
+        path, _ = QFileDialog.getOpenFileName(self, caption, init_dir, ext_filter, dcm_filter)
         if not path:
             return None
-        self.reset_all()
-        self.load_dcm_img(path) if img_ext == dcm_filter else self.load_img(path)
         self.dir = utils.get_parent_dir(path)
+        self.open_dir_img(path)
+
+    def open_dir_img(self, path: str):
+        self.reset_all()
+        self.open_img(path)
+        self.img_path = os.path.abspath(path)
+        self.prefetcher.prefetch(self.get_next_paths(path, 1)[:config.prefetch_count])
+        self.update_thumbnails()
+
+    # the images of the dir after path if step is 1, before it if step is -1, the nearest first
+    def get_next_paths(self, path: str, step: int):
+        path = os.path.abspath(path)
+        paths = utils.get_img_paths(os.path.dirname(path))
+        index = bisect.bisect_left(paths, path)
+        if step < 0:
+            return paths[:index][::-1]
+        # path may have been deleted meanwhile
+        return paths[index + 1:] if paths[index:index + 1] == [path] else paths[index:]
+
+    def open_next_img(self, step: int):
+        if not self.img_path:
+            self.warning('请先新建一个项目！')
+            return None
+        paths = self.get_next_paths(self.img_path, step)
+        if not paths:
+            self.status_bar.showMessage('已经是最后一张' if step > 0 else '已经是第一张', 1000)
+            return None
+        path = paths[0]
+        self.reset_all()
+        self.open_img(path)
+        # an image that can't be opened is stepped over next time
+        self.img_path = path
+        self.prefetcher.prefetch(paths[1:config.prefetch_count + 1])
+        self.update_thumbnails()
+
+    def prev_img(self):
+        self.open_next_img(-1)
+
+    def next_img(self):
+        self.open_next_img(1)
+
+    # ✔ for an image with the JSON of export_all or export_pivots next to it
+    def update_thumbnail_mark(self, path: str, labeled: Optional[bool] = None):
+        if (item := self.thumbnail_items.get(path)) is None:
+            return None
+        if labeled is None:
+            labeled = thumbnail.is_labeled(path)
+        item.setText(('✔ ' if labeled else '') + os.path.basename(path))
+        item.setForeground(QColor('green') if labeled else self.thumbnail_list.palette().text().color())
+
+    # the items are made again only when the dir, or the images in it, changed
+    def update_thumbnails(self):
+        if not self.img_path:
+            return None
+        dir_path = os.path.dirname(self.img_path)
+        if dir_path != self.thumbnail_dir or self.img_path not in self.thumbnail_items:
+            paths = utils.get_img_paths(dir_path)
+            labeled_stems = thumbnail.get_labeled_stems(dir_path)
+            self.thumbnail_dir = dir_path
+            self.thumbnail_list.clear()
+            self.thumbnail_items.clear()
+            for path in paths:
+                item = QListWidgetItem()
+                item.setData(Qt.UserRole, path)
+                item.setToolTip(path)
+                self.thumbnail_list.addItem(item)
+                self.thumbnail_items[path] = item
+                self.update_thumbnail_mark(path, os.path.splitext(os.path.basename(path))[0] in labeled_stems)
+            self.thumbnail_generation += 1
+            self.thumbnail_loader.load(self.thumbnail_generation, paths)
+        if (item := self.thumbnail_items.get(self.img_path)) is not None:
+            self.thumbnail_list.setCurrentItem(item)
+            self.thumbnail_list.scrollToItem(item)
+
+    def on_thumbnail_loaded(self, generation: int, path: str, png: bytes):
+        if generation != self.thumbnail_generation or (item := self.thumbnail_items.get(path)) is None:
+            return None
+        item.setIcon(QIcon(QPixmap.fromImage(QImage.fromData(png))))
+
+    def on_thumbnail_clicked(self, item: QListWidgetItem):
+        if (path := item.data(Qt.UserRole)) != self.img_path:
+            self.open_dir_img(path)
 
     def delete_img(self):
         if not self.src:
@@ -683,9 +1113,12 @@ class LabelApp(QMainWindow, Ui_form):
         if not self.src:
             self.warning('请先新建一个项目！')
             return None
-        img = self.src.copy()
+        if self.voi:
+            # the full size is windowed only when shown or saved
+            self.voi.get_mat()
+        img = self.src.convertToFormat(QImage.Format_RGB32)
         self.erase_highlight()
-        self.update_labels(img, True)
+        self.update_labels(img)
         caption = '保存'
         ext_filter = 'JPEG (*.jpg;*.jpeg;*.jpe);;PNG (*.png)'
         init_filter = 'JPEG (*.jpg;*.jpeg;*.jpe)'
@@ -707,26 +1140,8 @@ class LabelApp(QMainWindow, Ui_form):
             self.warning('JSON 文件不存在或不可读！')
         if data := utils.load_from_json(path):
             self.reset_except_img()
-            if len(data) == 1:
-                pivots: List[Tuple[int, float, float]] = data['pivots']
-                for index, x, y in pivots:
-                    self.points[index] = self.get_img_point(QPointF(x, y)), self.color
-                    self.pivots.add(index)
-            else:
-                points: List[Tuple[int, float, float, str]] = data['points']
-                for index, x, y, color in points:
-                    self.points[index] = self.get_img_point(QPointF(x, y)), QColor(color)
-                lines: List[Tuple[int, int, str]] = data['lines']
-                for index_a, index_b, color in lines:
-                    self.lines[utils.get_line_key(index_a, index_b)] = QColor(color)
-                angles: List[Tuple[int, int, int, str]] = data['angles']
-                for index_a, index_b, index_c, color in angles:
-                    self.angles[utils.get_angle_key(index_a, index_b, index_c)] = QColor(color)
-                circles: List[Tuple[int, int, str]] = data['circles']
-                for index_a, index_b, color in circles:
-                    self.circles[(index_a, index_b)] = QColor(color)
-                self.pivots = set(data['pivots'])
-            self.update_all()
+            LabelArrays.from_json(data, self.color.name()).update_store(self.labels)
+            self.refresh()
 
     def export_all(self):
         if not self.img:
@@ -741,22 +1156,8 @@ class LabelApp(QMainWindow, Ui_form):
         if utils.is_file_exists(path) and not utils.is_file_writable(path):
             self.warning('JSON 文件不可读！')
             return None
-        data = dict(points=[], lines=[], angles=[], circles=[], pivots=[])
-        points: List[Tuple[int, float, float, str]] = data['points']
-        for index, point in self.points.items():
-            src_point = self.get_src_point(point[0])
-            points.append((index, src_point.x(), src_point.y(), point[1].name()))
-        lines: List[Tuple[int, int, str]] = data['lines']
-        for index, color in self.lines.items():
-            lines.append((index[0], index[1], color.name()))
-        angles: List[Tuple[int, int, int, str]] = data['angles']
-        for index, color in self.angles.items():
-            angles.append((index[0], index[1], index[2], color.name()))
-        circles: List[Tuple[int, int, str]] = data['circles']
-        for index, color in self.circles.items():
-            circles.append((index[0], index[1], color.name()))
-        data['pivots'] = list(self.pivots)
-        utils.save_json_file(data, path)
+        utils.save_json_file(LabelArrays.from_store(self.labels).to_json(), path)
+        self.update_thumbnail_mark(self.img_path)
 
     def export_pivots(self):
         if not self.img:
@@ -771,12 +1172,8 @@ class LabelApp(QMainWindow, Ui_form):
         if utils.is_file_exists(json_path) and not utils.is_file_writable(json_path):
             self.warning('JSON 文件不可读！')
             return None
-        data = dict(pivots=[])
-        pivots: List[Tuple[int, float, float]] = data['pivots']
-        for index in self.pivots:
-            point = self.get_src_point(self.points[index][0])
-            pivots.append((index, point.x(), point.y()))
-        utils.save_json_file(data, json_path)
+        utils.save_json_file(LabelArrays.from_store(self.labels).to_pivots_json(), json_path)
+        self.update_thumbnail_mark(self.img_path)
 
     def inc_img_size(self):
         size = min(int(self.img_size * 100 + 10), 200)
@@ -803,7 +1200,7 @@ class LabelApp(QMainWindow, Ui_form):
         if not self.img:
             return None
         self.reset_except_img()
-        self.update_all()
+        self.refresh()
 
     def change_color(self):
         self.color = QColor(config.color_list[self.color_box.currentIndex()])
@@ -820,13 +1217,79 @@ class LabelApp(QMainWindow, Ui_form):
 
     def add_real_point(self, index, x: float, y: float):
         if self.img:
-            self.points[index] = self.get_img_point(QPointF(x, y)), self.color
+            self.labels.set_point(index, QPointF(x, y), self.color)
+            self.dirty.mark_points(index)
 
     def add_new_real_point(self, x: float, y: float):
         index = self.get_new_index()
         self.add_real_point(index, x, y)
         return index
 
+    def on_model_loaded(self):
+        self.model_ready = True
+        self.model_state.setText('模型：就绪')
+        self.model_state.setToolTip('')
+        self.auto_add_pts_btn.setEnabled(True)
+        if self.auto_label_img is not None:
+            img_id, self.auto_label_img = self.auto_label_img, None
+            if img_id == self.img_id:
+                self.auto_add_points()
+
+    # clicking auto label again retries the loading
+    def on_model_failed(self, err: str):
+        self.model_ready = False
+        self.model_state.setText('模型：加载失败')
+        self.model_state.setToolTip(err)
+        self.auto_add_pts_btn.setEnabled(True)
+        if self.auto_label_img is not None:
+            self.auto_label_img = None
+            self.warning(f'自动判断失败：{err}')
+
+    # load the model again off the GUI thread, then auto label the image
+    def retry_model_loading(self):
+        self.auto_label_img = self.img_id
+        if self.model_loader.isRunning():
+            return None
+        self.auto_add_pts_btn.setEnabled(False)
+        self.model_state.setText('模型：加载中')
+        self.model_loader.start()
+
+    def stop_workers(self):
+        self.cancel_auto_label()
+        if self.auto_labeler:
+            self.auto_labeler.wait()
+        self.model_loader.wait()
+        self.opener.shutdown()
+        self.prefetcher.shutdown()
+        self.thumbnail_loader.shutdown()
+
+    def cancel_auto_label(self):
+        if self.auto_labeler:
+            self.auto_labeler.cancel()
+            self.cancel_auto_label_btn.setEnabled(False)
+
+    def on_auto_labeled(self, img_id: int, points):
+        self.on_model_loaded()
+        if img_id != self.img_id or self.auto_labeler.cancelled:
+            return None
+        for point in points:
+            index = self.add_new_real_point(point[0], point[1])
+            self.add_pivots(index)
+        self.refresh()
+
+    def on_auto_label_failed(self, err: str):
+        from model import test
+        if not test.is_model_loaded():
+            self.on_model_failed(err)
+        self.warning(f'自动判断失败：{err}')
+
+    def on_auto_label_finished(self):
+        self.auto_labeler.deleteLater()
+        self.auto_labeler = None
+        self.auto_label_progress.hide()
+        self.cancel_auto_label_btn.hide()
+        self.auto_add_pts_btn.setEnabled(True)
+
     # add_real_point(index, x, y) or add_new_real_point(x, y)
     '''
     ----------> x
@@ -840,9 +1303,19 @@ class LabelApp(QMainWindow, Ui_form):
         if not self.src:
             self.warning('请先新建一个项目！')
             return None
-        cv2_img = utils.get_cv2_img(self.src)
-        points = test.auto_get_points(cv2_img)
-        for point in points:
-            index = self.add_new_real_point(point[0], point[1])
-            self.add_pivots(index)
-        self.update_all()
+        if self.auto_labeler:
+            return None
+        if not self.model_ready:
+            self.retry_model_loading()
+            return None
+        self.auto_labeler = AutoLabeler(self.voi.raw if self.voi else self.mat, bool(self.voi), self.img_id, self)
+        self.auto_labeler.progress.connect(self.auto_label_progress.setValue)
+        self.auto_labeler.labeled.connect(self.on_auto_labeled)
+        self.auto_labeler.failed.connect(self.on_auto_label_failed)
+        self.auto_labeler.finished.connect(self.on_auto_label_finished)
+        self.auto_add_pts_btn.setEnabled(False)
+        self.auto_label_progress.setValue(0)
+        self.auto_label_progress.show()
+        self.cancel_auto_label_btn.setEnabled(True)
+        self.cancel_auto_label_btn.show()
+        self.auto_labeler.start()
@@ -0,0 +1,240 @@
+import argparse
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from model import test
+from model.cache import get_img_hash
+from module import utils
+from module.frames import DicomFrames, read_frame_count, rename_frame_path
+import os
+import sys
+import threading
+import time
+import torch
+from typing import Deque, Iterator, List, Optional, Tuple
+
+
+# an image, or a frame of a multi-frame DICOM
+Item = Tuple[str, Optional[int]]
+
+
+def get_item_name(item: Item):
+    path, frame = item
+    return path if frame is None else f'{path} [{frame + 1}]'
+
+
+def walk_img_paths(root: str) -> Iterator[str]:
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if utils.is_img_path(file_name):
+                yield os.path.join(dir_path, file_name)
+
+
+# the frames of a multi-frame DICOM, the image itself otherwise
+def get_path_items(path: str) -> List[Item]:
+    count = read_frame_count(path) if utils.is_dcm_path(path) else 1
+    return [(path, None)] if count == 1 else [(path, frame) for frame in range(count)]
+
+
+# frames is the DicomFrames of the path, kept for its next frames
+def load_item_img(item: Item, frames: Optional[DicomFrames] = None):
+    path, frame = item
+    if frame is None:
+        return utils.load_cv2_img(path)
+    return utils.get_bgr_view(utils.get_raw_mat((frames or DicomFrames(path, 0)).get_raw(frame)))
+
+
+# <root>/a/b.dcm -> <out_dir>/a/b.json, or <out_dir>/a/b_frame3.json for its frame of index 2,
+# next to the image if out_dir is None
+def get_json_path(path: str, root: str, out_dir: Optional[str], frame: Optional[int] = None):
+    json_path = utils.rename_path_ext(path, '.json') if frame is None else rename_frame_path(path, frame, '.json')
+    if out_dir:
+        json_path = os.path.join(out_dir, os.path.relpath(json_path, root))
+    return json_path
+
+
+class Pipeline:
+    """
+    decode -> preprocess -> forward -> post-process -> export
+
+    decoding, preprocessing and post-processing run on a thread pool,
+    the forward pass runs batch_size images at a time on the calling thread
+    and overlaps with them
+
+    every frame of a multi-frame DICOM is an image of its own, decoded when it is loaded,
+    the last DICOMs opened are kept for their next frames
+    """
+
+    def __init__(
+            self, root: str, out_dir: Optional[str] = None, workers: int = 4, batch_size: int = 8,
+            skip_existing: bool = False, use_cache: bool = True
+    ):
+        self.root = root
+        self.out_dir = out_dir
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.skip_existing = skip_existing
+        self.cache = test.get_cache() if use_cache else None
+        self.done = 0
+        self.skipped = 0
+        self.failed: List[Tuple[str, str]] = []
+        self.dcm_frames: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_frames(self, path: str) -> DicomFrames:
+        with self.lock:
+            if (frames := self.dcm_frames.get(path)) is None:
+                frames = self.dcm_frames[path] = DicomFrames(path, 0)
+                while len(self.dcm_frames) > self.workers:
+                    self.dcm_frames.popitem(last=False)
+            return frames
+
+    def load_img(self, item: Item):
+        return load_item_img(item, None if item[1] is None else self.get_frames(item[0]))
+
+    # input_map, ori_size, img_hash, or the cached points
+    def load(self, item: Item):
+        img = self.load_img(item)
+        if img is None:
+            raise ValueError('unsupported image')
+        img_hash = None
+        if self.cache:
+            img_hash = get_img_hash(img)
+            if (cached := self.cache.get(img_hash)) is not None:
+                return None, img.shape[:2], img_hash, cached[0]
+        return test.normalize_image(img), img.shape[:2], img_hash, None
+
+    def write(self, item: Item, points):
+        json_path = get_json_path(item[0], self.root, self.out_dir, item[1])
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        utils.save_json_file(utils.get_pivots_labels(points), json_path)
+
+    def save(self, items: List[Item], hm, ori_sizes, img_hashes: List[Optional[str]]):
+        failed = []
+        preds, maxvals = test.get_ori_preds_and_maxvals(hm, ori_sizes)
+        for item, points, confs, img_hash in zip(items, preds, maxvals, img_hashes):
+            try:
+                if self.cache:
+                    self.cache.put(img_hash, points, confs)
+                self.write(item, points)
+            except Exception as err:
+                failed.append((item, err))
+        return failed
+
+    def save_cached(self, item: Item, points):
+        self.write(item, points)
+        return []
+
+    def fail(self, item: Item, err: BaseException):
+        name = get_item_name(item)
+        self.failed.append((name, str(err)))
+        print(f'{name}: {err}', file=sys.stderr)
+
+    def collect(self, saving: Deque[Tuple[List[Item], Future]], limit: int):
+        while len(saving) > limit:
+            items, future = saving.popleft()
+            try:
+                failed = future.result()
+            except Exception as err:
+                failed = [(item, err) for item in items]
+            for item, err in failed:
+                self.fail(item, err)
+            self.done += len(items) - len(failed)
+
+    def get_items(self):
+        for path in walk_img_paths(self.root):
+            try:
+                items = get_path_items(path)
+            except Exception as err:
+                self.fail((path, None), err)
+                continue
+            for _, frame in items:
+                if self.skip_existing and utils.is_file_exists(get_json_path(path, self.root, self.out_dir, frame)):
+                    self.skipped += 1
+                    continue
+                yield path, frame
+
+    def forward(self, batch: List[Tuple[Item, Tuple]]):
+        items = [item for item, _ in batch]
+        input_map = torch.stack([loaded[0] for _, loaded in batch])
+        ori_sizes = [loaded[1] for _, loaded in batch]
+        img_hashes = [loaded[2] for _, loaded in batch]
+        return items, test.get_heatmaps(test.get_model(), input_map), ori_sizes, img_hashes
+
+    def run(self):
+        test.get_model()
+        items = self.get_items()
+        with ThreadPoolExecutor(self.workers) as pool:
+            # bound the decoded inputs and the heatmaps waiting in the pool
+            loading: Deque[Tuple[Item, Future]] = deque()
+            saving: Deque[Tuple[List[Item], Future]] = deque()
+
+            def submit_load():
+                if (next_item := next(items, None)) is not None:
+                    loading.append((next_item, pool.submit(self.load, next_item)))
+
+            for _ in range(self.batch_size + 2 * self.workers):
+                submit_load()
+            batch: List[Tuple[Item, Tuple]] = []
+            while loading or batch:
+                if loading:
+                    item, future = loading.popleft()
+                    submit_load()
+                    try:
+                        loaded = future.result()
+                    except Exception as err:
+                        self.fail(item, err)
+                    else:
+                        if loaded[3] is not None:
+                            # a fully cached rerun makes no forward pass to collect after
+                            saving.append(([item], pool.submit(self.save_cached, item, loaded[3])))
+                            self.collect(saving, self.workers)
+                        else:
+                            batch.append((item, loaded))
+                    if len(batch) < self.batch_size and loading:
+                        continue
+                if not batch:
+                    continue
+                try:
+                    batch_items, hm, ori_sizes, img_hashes = self.forward(batch)
+                except Exception as err:
+                    for item, _ in batch:
+                        self.fail(item, err)
+                else:
+                    saving.append(
+                        (batch_items, pool.submit(self.save, batch_items, hm, ori_sizes, img_hashes))
+                    )
+                    self.collect(saving, max(self.workers // self.batch_size, 1))
+                batch = []
+            self.collect(saving, 0)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m module.batch', description='auto label every DICOM / JPEG / PNG under a directory'
+    )
+    parser.add_argument('root', help='directory to walk')
+    parser.add_argument('-o', '--out-dir', help='mirror the JSON files here instead of next to the images')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='size of the worker pool')
+    parser.add_argument('-b', '--batch-size', type=int, default=8, help='images per forward pass')
+    parser.add_argument('-e', '--engine', default=test.engine_name, help='torch / torchscript / int8 / onnx')
+    parser.add_argument('-m', '--model-path', help="weights of the engine, default: the engine's own")
+    parser.add_argument('--no-cache', action='store_true', help="don't read or write the prediction cache")
+    parser.add_argument('--skip-existing', action='store_true', help='skip images whose JSON already exists')
+    args = parser.parse_args(argv)
+
+    test.set_engine(args.engine, args.model_path)
+    pipeline = Pipeline(
+        args.root, args.out_dir, args.workers, args.batch_size, args.skip_existing, not args.no_cache
+    )
+    begin = time.perf_counter()
+    pipeline.run()
+    print(
+        f'{pipeline.done} labeled, {pipeline.skipped} skipped, {len(pipeline.failed)} failed '
+        f'in {time.perf_counter() - begin:.1f}s'
+    )
+    return 1 if pipeline.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
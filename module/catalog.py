@@ -0,0 +1,192 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from module import utils
+import os
+from pydicom import dcmread
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+dicomdir_name = 'DICOMDIR'
+dcm_ext = '.dcm'
+
+# the columns of a file besides its path, mtime and size
+header_columns = utils.dcm_info_names + ('PixelSpacingX', 'PixelSpacingY')
+
+
+def get_default_catalog_path():
+    return os.path.join(os.path.expanduser('~'), '.label_dcm', 'catalog.sqlite')
+
+
+# the files referenced by a DICOMDIR, relative to its directory
+def read_dicomdir(path: str) -> List[str]:
+    dicomdir = dcmread(path, stop_before_pixels=True)
+    root = os.path.dirname(path)
+    paths = []
+    for record in getattr(dicomdir, 'DirectoryRecordSequence', ()):
+        if file_id := getattr(record, 'ReferencedFileID', None):
+            parts = [file_id] if isinstance(file_id, str) else list(file_id)
+            paths.append(os.path.normpath(os.path.join(root, *parts)))
+    return paths
+
+
+# DICOM files under root with their mtime and size, through the DICOMDIRs where there are some,
+# otherwise *.dcm and files without an extension
+def walk_dcm_files(root: str) -> Iterator[Tuple[str, float, int]]:
+    for dir_path, dir_names, file_names in os.walk(root):
+        if dicomdir_name in file_names:
+            dir_names.clear()
+            for path in read_dicomdir(os.path.join(dir_path, dicomdir_name)):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+            continue
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1].lower() in (dcm_ext, ''):
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+
+# the header columns of a file, None if it isn't DICOM
+def read_header(path: str) -> Optional[tuple]:
+    try:
+        dcm = dcmread(path, stop_before_pixels=True, specific_tags=list(utils.dcm_info_names) + ['PixelSpacing'])
+    except Exception:
+        return None
+    header = utils.get_dcm_header(dcm)
+    pixel_spacing = utils.get_dcm_pixel_spacing(dcm) or (None, None)
+    return tuple(header[name] for name in utils.dcm_info_names) + tuple(
+        None if value is None else float(value) for value in pixel_spacing
+    )
+
+
+def read_headers(paths: List[str]) -> List[Optional[tuple]]:
+    return [read_header(path) for path in paths]
+
+
+class DicomCatalog:
+    """
+    path -> the headers of the patient info and the pixel spacing of every DICOM file under the scanned roots
+
+    files are read again only when their mtime or size changed, files gone are dropped,
+    files that aren't DICOM are kept without headers so that they aren't read again either
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_default_catalog_path()
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        columns = ', '.join(f'{column} {"REAL" if column.startswith("PixelSpacing") else "TEXT"}'
+                            for column in header_columns)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS files '
+                f'(path TEXT PRIMARY KEY, mtime REAL, size INTEGER, is_dcm INTEGER, {columns})'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS files_patient ON files (PatientID)')
+
+    # the rows of paths under root, by the range of their prefix
+    def get_range(self, root: str):
+        prefix = os.path.join(os.path.abspath(root), '')
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def get_stats(self, root: str) -> Dict[str, Tuple[float, int]]:
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT path, mtime, size FROM files WHERE path >= ? AND path < ?', self.get_range(root)
+            ).fetchall()
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def put(self, rows: List[tuple]):
+        with self.lock, self.conn:
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO files VALUES ({", ".join("?" * (4 + len(header_columns)))})', rows
+            )
+
+    def remove(self, paths: List[str]):
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in paths])
+
+    # (new or changed, unchanged, removed) files
+    def scan(self, root: str, workers: int = 1, chunk_size: int = 256):
+        root = os.path.abspath(root)
+        known = self.get_stats(root)
+        changed: List[Tuple[str, float, int]] = []
+        unchanged = 0
+        for path, mtime, size in walk_dcm_files(root):
+            if known.pop(path, None) == (mtime, size):
+                unchanged += 1
+            else:
+                changed.append((path, mtime, size))
+        self.remove(list(known))
+        chunks = [changed[begin:begin + chunk_size] for begin in range(0, len(changed), chunk_size)]
+
+        def put_chunk(chunk: List[Tuple[str, float, int]], headers: List[Optional[tuple]]):
+            self.put([
+                (path, mtime, size, header is not None) + (header or (None,) * len(header_columns))
+                for (path, mtime, size), header in zip(chunk, headers)
+            ])
+
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                for chunk, headers in zip(chunks, pool.map(read_headers, [[path for path, _, _ in chunk]
+                                                                          for chunk in chunks])):
+                    put_chunk(chunk, headers)
+        else:
+            for chunk in chunks:
+                put_chunk(chunk, read_headers([path for path, _, _ in chunk]))
+        return len(changed), unchanged, len(known)
+
+    def get_files(self, root: str, keyword: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
+        sql = f'SELECT path, {", ".join(header_columns)} FROM files WHERE is_dcm AND path >= ? AND path < ?'
+        args = self.get_range(root)
+        if keyword:
+            sql += ' AND (PatientID LIKE ? OR PatientName LIKE ?)'
+            args += (f'%{keyword}%',) * 2
+        with self.lock:
+            rows = self.conn.execute(sql + ' ORDER BY path', args).fetchall()
+        return [dict(zip(('path',) + header_columns, row)) for row in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m module.catalog', description='index the DICOM headers under a directory'
+    )
+    parser.add_argument('root', help='directory to scan, through its DICOMDIR if it has one')
+    parser.add_argument('--db', help='catalog file, default: ~/.label_dcm/catalog.sqlite')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='processes reading headers')
+    parser.add_argument('-s', '--search', help='list the files whose PatientID or PatientName contains this')
+    parser.add_argument('-l', '--list', action='store_true', help='list every DICOM file after scanning')
+    args = parser.parse_args(argv)
+
+    catalog = DicomCatalog(args.db)
+    begin = time.perf_counter()
+    changed, unchanged, removed = catalog.scan(args.root, args.workers)
+    print(
+        f'{changed} read, {unchanged} unchanged, {removed} removed in {time.perf_counter() - begin:.1f}s',
+        file=sys.stderr
+    )
+    if args.search or args.list:
+        for row in catalog.get_files(args.root, args.search):
+            print('\t'.join(str(row[column] or '') for column in ('path', 'PatientID', 'PatientName', 'StudyDate')))
+    catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,7 @@ class ModeNameDict(dict):
         self[LabelMode.VERTICAL_MODE] = '直角'
         self[LabelMode.MOVE_POINT_MODE] = '移动点'
         self[LabelMode.ERASE_POINT_MODE] = '删除点'
+        self[LabelMode.WINDOW_MODE] = '窗宽窗位'
 
 
 class Config:
@@ -44,9 +45,33 @@ class Config:
         self.action_mode_list = (
             LabelMode.DEFAULT_MODE, LabelMode.POINT_MODE, LabelMode.LINE_MODE, LabelMode.ANGLE_MODE,
             LabelMode.CIRCLE_MODE, LabelMode.MIDPOINT_MODE, LabelMode.VERTICAL_MODE, LabelMode.MOVE_POINT_MODE,
-            LabelMode.ERASE_POINT_MODE
+            LabelMode.ERASE_POINT_MODE, LabelMode.WINDOW_MODE
         )
-        self.action_name_list = ('无', '点', '线', '角', '圆', '中点', '直角', '移动点', '删除点')
+        self.action_name_list = ('无', '点', '线', '角', '圆', '中点', '直角', '移动点', '删除点', '窗宽窗位')
+
+        # window
+        # for DICOM, dragging this many pixels moves the window across the whole range of the pixel values
+        self.window_drag_range = 2 ** 9
+
+        # prefetch
+        # the images after (and before) the one opened that are decoded ahead, and the memory kept of decoded ones
+        self.prefetch_count = 3
+        self.prefetch_workers = 2
+        self.prefetch_cache_bytes = 2 ** 30
+
+        # preview
+        # while a file this large is opened, a preview this wide or high is shown, if there's a quick way to it
+        self.preview_min_bytes = 2 ** 22
+        self.preview_size = 2 ** 10
+
+        # thumbnail
+        # the thumbnails of the images of the dir fit in this size, and are kept on disk for this many images
+        self.thumbnail_size = 2 ** 7
+        self.thumbnail_max_entries = 2 ** 14
+
+        # frame
+        # for multi-frame DICOM, the frames whose windows are kept once decoded
+        self.frame_cache_count = 8
 
         # indent
         # for JSON
@@ -0,0 +1,64 @@
+from module.annotation import Erased
+from typing import Set, Tuple
+
+
+class Dirty:
+    """
+    parts of the view to recompute on the next refresh
+
+    img: the size of the image shown
+    pixels: the pixels of the image shown, e.g. after windowing
+    labels: every annotation, e.g. after importing or switching frames
+    points: points added, moved or recolored, with the lines, angles and circles on them
+    erased: annotations erased or renumbered, whose items go
+    pivots: the pivots panel
+    lines, circles: lines and circles recolored, e.g. highlighted on hover
+    """
+
+    def __init__(self):
+        self.img = False
+        self.pixels = False
+        self.labels = False
+        self.points: Set[int] = set()
+        self.erased = Erased()
+        self.pivots = False
+        self.lines: Set[Tuple[int, int]] = set()
+        self.circles: Set[Tuple[int, int]] = set()
+
+    def mark_img(self):
+        self.img = True
+
+    def mark_pixels(self):
+        self.pixels = True
+
+    def mark_labels(self):
+        self.labels = True
+
+    def mark_points(self, *indexs: int):
+        self.points.update(indexs)
+
+    def mark_erased(self, erased: Erased):
+        self.erased.update(erased)
+
+    def mark_pivots(self):
+        self.pivots = True
+
+    def mark_lines(self, *keys: Tuple[int, int]):
+        self.lines.update(keys)
+
+    def mark_circles(self, *keys: Tuple[int, int]):
+        self.circles.update(keys)
+
+    def is_dirty(self):
+        return self.img or self.pixels or self.labels or bool(self.points) or not self.erased.is_empty() \
+               or self.pivots or bool(self.lines) or bool(self.circles)
+
+    def clear(self):
+        self.img = False
+        self.pixels = False
+        self.labels = False
+        self.points.clear()
+        self.erased.clear()
+        self.pivots = False
+        self.lines.clear()
+        self.circles.clear()
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from module import utils
+from module.config import config
+from module.voi import VoiWindow
+import numpy
+from pydicom import dcmread, Dataset
+from pydicom.encaps import encapsulate, generate_pixel_data_frame
+import re
+import threading
+from typing import List, Optional
+
+
+frame_suffix = '_frame'
+
+# the attributes pydicom decodes one frame with
+pixel_names = (
+    'Rows', 'Columns', 'SamplesPerPixel', 'BitsAllocated', 'BitsStored', 'HighBit', 'PixelRepresentation',
+    'PhotometricInterpretation', 'PlanarConfiguration'
+)
+
+
+def get_frame_count(dcm: Dataset):
+    return int(getattr(dcm, 'NumberOfFrames', 1) or 1)
+
+
+def read_frame_count(path: str):
+    return get_frame_count(dcmread(path, stop_before_pixels=True, specific_tags=['NumberOfFrames']))
+
+
+# a.dcm and the frame of index 2 -> a_frame3 + ext, frames are counted from 1 as in DICOM
+def rename_frame_path(path: str, index: int, ext: str):
+    return utils.rename_path_ext(path, f'{frame_suffix}{index + 1}{ext}')
+
+
+# a_frame3 -> a
+def strip_frame_suffix(stem: str):
+    return re.sub(rf'{frame_suffix}\d+$', '', stem)
+
+
+class DicomFrames:
+    """
+    the frames of a DICOM, each one decoded when it is first used, and the windows of the last cache_count used
+
+    mapped pixel data is sliced, encapsulated pixel data is split into frames once and a frame is decoded alone,
+    other pixel data, e.g. big endian, is decoded whole on first use
+    """
+
+    def __init__(self, path: str, cache_count: int = config.frame_cache_count):
+        self.path = path
+        self.dcm, self.raw = utils.map_dcm_pixels(path)
+        self.count = get_frame_count(self.dcm)
+        self.cache_count = cache_count
+        self.frames: Optional[List[bytes]] = None
+        self.vois: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def is_encapsulated(self):
+        return self.raw is None and self.count > 1 and self.dcm.file_meta.TransferSyntaxUID.is_compressed
+
+    def get_raw(self, index: int) -> numpy.ndarray:
+        if self.is_encapsulated():
+            return self.decode_frame(index)
+        with self.lock:
+            if self.raw is None:
+                self.raw = self.dcm.pixel_array
+        return self.raw[index] if self.count > 1 else self.raw
+
+    def decode_frame(self, index: int):
+        with self.lock:
+            if self.frames is None:
+                self.frames = list(generate_pixel_data_frame(self.dcm.PixelData, self.count))
+                # the frames hold the bytes from now on
+                del self.dcm.PixelData
+        frame = Dataset()
+        frame.file_meta = self.dcm.file_meta
+        frame.is_little_endian = self.dcm.is_little_endian
+        frame.is_implicit_VR = self.dcm.is_implicit_VR
+        for name in pixel_names:
+            if name in self.dcm:
+                setattr(frame, name, self.dcm[name].value)
+        frame.PixelData = encapsulate([self.frames[index]])
+        return frame.pixel_array
+
+    def get_voi(self, index: int) -> VoiWindow:
+        if (voi := self.vois.get(index)) is not None:
+            self.vois.move_to_end(index)
+            return voi
+        voi = VoiWindow(self.dcm, self.get_raw(index))
+        if self.cache_count > 0:
+            self.vois[index] = voi
+            while len(self.vois) > self.cache_count:
+                self.vois.popitem(last=False)
+        return voi
+
+    def get_bytes(self):
+        size = sum(voi.get_bytes() for voi in self.vois.values())
+        if self.raw is not None and not isinstance(self.raw, numpy.memmap):
+            size += self.raw.nbytes
+        return size + sum(len(frame) for frame in self.frames or ())
+
+
+def get_dcm_frames_with_info(path: str):
+    frames = DicomFrames(path)
+    md_info, pixel_spacing = utils.get_dcm_info(frames.dcm)
+    return frames, md_info, pixel_spacing
@@ -0,0 +1,128 @@
+from module.config import config
+import numpy
+from typing import Optional, Tuple
+
+
+# the geometry of utils on (N, 2) arrays of points, one row per shape
+
+eps = config.eps
+base = config.base
+ratio_to_radius = config.ratio_to_radius
+distance_shifting = config.distance_shifting
+degree_shifting_base = config.degree_shifting_base
+degree_shifting_more = config.degree_shifting_more
+
+
+def as_points(points) -> numpy.ndarray:
+    return numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+
+
+# per row the shift of the first true condition, or the default
+def select_shifts(conditions, shifts, default):
+    return numpy.select(
+        [condition[:, None] for condition in conditions], numpy.array(shifts, dtype=numpy.float64), default
+    )
+
+
+def get_midpoints(a: numpy.ndarray, b: numpy.ndarray):
+    return (a + b) / 2
+
+
+def get_distances(a: numpy.ndarray, b: numpy.ndarray):
+    d = a - b
+    dis = numpy.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1])
+    return numpy.where(dis > eps, dis, eps)
+
+
+# lengths in mm with pixel spacing, in pixels without
+def get_lengths(a: numpy.ndarray, b: numpy.ndarray, pixel_spacing: Optional[Tuple[float, float]] = None):
+    if pixel_spacing:
+        a = a * pixel_spacing
+        b = b * pixel_spacing
+    return get_distances(a, b)
+
+
+def get_distance_shifts(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    dx = a[:, 0] - b[:, 0]
+    dy = a[:, 1] - b[:, 1]
+    return c + select_shifts(
+        [numpy.abs(dx) < eps, numpy.abs(dy) < eps, dx * dy < 0],
+        [(distance_shifting, 0), (0, -distance_shifting), (distance_shifting, distance_shifting)],
+        numpy.array((distance_shifting, -distance_shifting), dtype=numpy.float64)
+    )
+
+
+def get_radii(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    return numpy.minimum(get_distances(b, a), get_distances(b, c)) * ratio_to_radius
+
+
+def get_diag_points(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    r = get_radii(a, b, c)[:, None]
+    return b - r, b + r
+
+
+def get_dis_points(a: numpy.ndarray, b: numpy.ndarray, dis):
+    ratio = (dis / get_distances(a, b))[:, None]
+    return a + (b - a) * ratio
+
+
+def get_arc_midpoints(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    return get_dis_points(
+        b, get_midpoints(get_dis_points(b, a, base), get_dis_points(b, c, base)), get_radii(a, b, c)
+    )
+
+
+# ba · bc
+def get_dots(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    ba = a - b
+    bc = c - b
+    return ba[:, 0] * bc[:, 0] + ba[:, 1] * bc[:, 1]
+
+
+# ba × bc
+def get_crosses(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    ba = a - b
+    bc = c - b
+    return ba[:, 0] * bc[:, 1] - bc[:, 0] * ba[:, 1]
+
+
+def get_degrees(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    cos = get_dots(a, b, c) / get_distances(b, a) / get_distances(b, c)
+    return numpy.degrees(numpy.arccos(numpy.clip(cos, -1, 1)))
+
+
+def get_begin_degrees(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    d = numpy.where((get_crosses(a, b, c) > 0)[:, None], c, a)
+    deg = get_degrees(d, b, b + (base, 0))
+    return numpy.where(d[:, 1] > b[:, 1], 360 - deg, deg)
+
+
+# the first matching case of utils.get_degree_shift
+def get_degree_shifts(a: numpy.ndarray, b: numpy.ndarray):
+    same_x = numpy.abs(a[:, 0] - b[:, 0]) < eps
+    same_y = numpy.abs(a[:, 1] - b[:, 1]) < eps
+    above = a[:, 1] > b[:, 1] + eps
+    below = a[:, 1] + eps < b[:, 1]
+    right = a[:, 0] > b[:, 0] + eps
+    left = a[:, 0] + eps < b[:, 0]
+    return b + select_shifts(
+        [above & same_x, below & same_x, right & same_y, left & same_y, left & above, right & above, right & below],
+        [
+            (0, -degree_shifting_base), (0, degree_shifting_base), (-degree_shifting_more, 0),
+            (degree_shifting_base, 0), (degree_shifting_base, -degree_shifting_base),
+            (-degree_shifting_more, -degree_shifting_base), (-degree_shifting_more, degree_shifting_base)
+        ],
+        numpy.array((degree_shifting_base, degree_shifting_base), dtype=numpy.float64)
+    )
+
+
+# ab: da · x + db · y + dc = 0
+def get_foot_points(a: numpy.ndarray, b: numpy.ndarray, c: numpy.ndarray):
+    da = a[:, 1] - b[:, 1]
+    db = b[:, 0] - a[:, 0]
+    dc = -da * a[:, 0] - db * a[:, 1]
+    norm = da * da + db * db
+    return numpy.stack([
+        (db * db * c[:, 0] - da * db * c[:, 1] - da * dc) / norm,
+        (da * da * c[:, 1] - da * db * c[:, 0] - db * dc) / norm
+    ], axis=1)
@@ -0,0 +1,264 @@
+import math
+from module.config import config
+from module.pyramid import ImagePyramid, TileCache
+from PyQt5.QtCore import QPoint, QPointF, QRect, QRectF, QSize, Qt
+from PyQt5.QtGui import QColor, QFont, QFontMetricsF, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+from typing import Optional
+
+
+def get_font():
+    font = QFont(config.font_family)
+    font.setPointSizeF(config.font_size)
+    return font
+
+
+def get_text_rect(font: QFont, text: str, offset: QPointF):
+    return QFontMetricsF(font).boundingRect(text).translated(offset).adjusted(-1, -1, 1, 1)
+
+
+class LabelItem(QGraphicsItem):
+    """
+    an annotation in source coordinates drawn with a round cap cosmetic pen, updated in place
+
+    zoom is the scale of the view, the pen doesn't scale with it
+    """
+
+    def __init__(self, width: float, parent: Optional[QGraphicsItem] = None):
+        super().__init__(parent)
+        self.pen = QPen()
+        self.pen.setCapStyle(Qt.RoundCap)
+        self.pen.setCosmetic(True)
+        self.pen.setWidthF(width)
+        self.font = get_font()
+        self.zoom = 1
+
+    def set_color(self, color: QColor):
+        if self.pen.color() != color:
+            self.pen.setColor(color)
+            self.update()
+
+    def set_zoom(self, zoom: float):
+        if zoom != self.zoom:
+            self.prepareGeometryChange()
+            self.zoom = zoom
+
+    # in screen pixels for the items ignoring transformations
+    def get_margin(self):
+        margin = self.pen.widthF() / 2 + 1
+        return margin if self.flags() & QGraphicsItem.ItemIgnoresTransformations else margin / self.zoom
+
+    def prepare(self, painter: QPainter):
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setPen(self.pen)
+        painter.setFont(self.font)
+
+
+# a text at anchor + offset, the offset doesn't scale with the view
+class TextItem(LabelItem):
+    def __init__(self, parent: Optional[QGraphicsItem] = None):
+        super().__init__(0, parent)
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.text = ''
+        self.offset = QPointF()
+
+    def set_text(self, anchor: QPointF, offset: QPointF, text: str):
+        if text != self.text or offset != self.offset:
+            self.prepareGeometryChange()
+            self.text = text
+            self.offset = offset
+        if anchor != self.pos():
+            self.setPos(anchor)
+
+    def boundingRect(self):
+        return get_text_rect(self.font, self.text, self.offset)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        self.prepare(painter)
+        painter.drawText(self.offset, self.text)
+
+
+# a point and its index
+class PointItem(LabelItem):
+    def __init__(self):
+        super().__init__(config.point_width)
+        self.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+        self.text = ''
+        self.text_offset = QPointF(config.index_shifting, -config.index_shifting)
+
+    def set_point(self, point: QPointF, index: int):
+        if str(index) != self.text:
+            self.prepareGeometryChange()
+            self.text = str(index)
+        if point != self.pos():
+            self.setPos(point)
+
+    def boundingRect(self):
+        margin = self.get_margin()
+        return QRectF(-margin, -margin, 2 * margin, 2 * margin) \
+            .united(get_text_rect(self.font, self.text, self.text_offset))
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        self.prepare(painter)
+        painter.drawPoint(QPointF(0, 0))
+        painter.drawText(self.text_offset, self.text)
+
+
+# a line and its length
+class LineItem(LabelItem):
+    def __init__(self):
+        super().__init__(config.line_width)
+        self.a = QPointF()
+        self.b = QPointF()
+        self.label = TextItem(self)
+
+    def set_color(self, color: QColor):
+        super().set_color(color)
+        self.label.set_color(color)
+
+    def set_line(self, a: QPointF, b: QPointF, anchor: QPointF, offset: QPointF, text: str):
+        if a != self.a or b != self.b:
+            self.prepareGeometryChange()
+            self.a = QPointF(a)
+            self.b = QPointF(b)
+        self.label.set_text(anchor, offset, text)
+
+    def boundingRect(self):
+        margin = self.get_margin()
+        return QRectF(self.a, self.b).normalized().adjusted(-margin, -margin, margin, margin)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        self.prepare(painter)
+        painter.drawLine(self.a, self.b)
+
+
+# an arc and its degree
+class AngleItem(LabelItem):
+    def __init__(self):
+        super().__init__(config.angle_width)
+        self.rect = QRectF()
+        self.begin = 0
+        self.span = 0
+        self.label = TextItem(self)
+
+    def set_color(self, color: QColor):
+        super().set_color(color)
+        self.label.set_color(color)
+
+    def set_arc(self, rect: QRectF, begin: int, span: int, anchor: QPointF, offset: QPointF, text: str):
+        if rect != self.rect:
+            self.prepareGeometryChange()
+            self.rect = QRectF(rect)
+        if begin != self.begin or span != self.span:
+            self.begin = begin
+            self.span = span
+            self.update()
+        self.label.set_text(anchor, offset, text)
+
+    def boundingRect(self):
+        margin = self.get_margin()
+        return self.rect.normalized().adjusted(-margin, -margin, margin, margin)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        self.prepare(painter)
+        painter.drawArc(self.rect, self.begin, self.span)
+
+
+class CircleItem(LabelItem):
+    def __init__(self):
+        super().__init__(config.line_width)
+        self.rect = QRectF()
+
+    def set_rect(self, rect: QRectF):
+        if rect != self.rect:
+            self.prepareGeometryChange()
+            self.rect = QRectF(rect)
+
+    def boundingRect(self):
+        margin = self.get_margin()
+        return self.rect.normalized().adjusted(-margin, -margin, margin, margin)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        self.prepare(painter)
+        painter.drawEllipse(self.rect)
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    the source image shown at zoom, painted from the nearest pyramid level tile by tile
+
+    only the exposed tiles are resampled, and they are kept for later repaints and zoom levels
+    """
+
+    tile_size = 256
+
+    def __init__(self):
+        super().__init__()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.pyramid: Optional[ImagePyramid] = None
+        self.zoom = 1
+        self.tiles = TileCache()
+
+    def set_pyramid(self, pyramid: Optional[ImagePyramid]):
+        self.prepareGeometryChange()
+        self.pyramid = pyramid
+        self.tiles.clear()
+
+    def set_zoom(self, zoom: float):
+        if zoom != self.zoom:
+            self.zoom = zoom
+            self.update()
+
+    # the pixels of the source changed, not its size
+    def reset_pixels(self):
+        if self.pyramid:
+            self.pyramid.reset()
+        self.tiles.clear()
+        self.update()
+
+    def boundingRect(self):
+        return QRectF(self.pyramid.levels[0].rect()) if self.pyramid else QRectF()
+
+    # size of the image on screen
+    def get_size(self):
+        src = self.pyramid.levels[0]
+        return QSize(math.ceil(src.width() * self.zoom), math.ceil(src.height() * self.zoom))
+
+    # resample a tile of the level with a margin, so that neighbouring tiles join seamlessly
+    def get_tile(self, size: QSize, tx: int, ty: int):
+        key = (self.zoom, tx, ty)
+        if (tile := self.tiles.get(key)) is not None:
+            return tile
+        _, level = self.pyramid.get_level(size.width())
+        sx = self.zoom * self.pyramid.levels[0].width() / level.width()
+        sy = self.zoom * self.pyramid.levels[0].height() / level.height()
+        rect = QRect(tx * self.tile_size, ty * self.tile_size, self.tile_size, self.tile_size) \
+            .intersected(QRect(QPoint(0, 0), size))
+        x0 = max(math.floor(rect.left() / sx) - 2, 0)
+        y0 = max(math.floor(rect.top() / sy) - 2, 0)
+        x1 = min(math.ceil((rect.right() + 1) / sx) + 2, level.width())
+        y1 = min(math.ceil((rect.bottom() + 1) / sy) + 2, level.height())
+        tile = QPixmap(rect.size())
+        painter = QPainter(tile)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        painter.translate(-rect.left(), -rect.top())
+        painter.scale(sx, sy)
+        source = QRectF(x0, y0, x1 - x0, y1 - y0)
+        painter.drawImage(source, level, source)
+        painter.end()
+        self.tiles.put(key, tile)
+        return tile
+
+    # tiles are laid out and drawn in screen pixels
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: Optional[QWidget] = None):
+        if not self.pyramid:
+            return None
+        size = self.get_size()
+        if size.isEmpty():
+            return None
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        exposed = QRectF(exposed.topLeft() * self.zoom, exposed.bottomRight() * self.zoom)
+        painter.scale(1 / self.zoom, 1 / self.zoom)
+        for ty in range(int(exposed.top()) // self.tile_size, math.ceil(exposed.bottom() / self.tile_size)):
+            for tx in range(int(exposed.left()) // self.tile_size, math.ceil(exposed.right() / self.tile_size)):
+                painter.drawPixmap(tx * self.tile_size, ty * self.tile_size, self.get_tile(size, tx, ty))
@@ -12,3 +12,4 @@ class LabelMode(Enum):
     VERTICAL_MODE = enum.auto()
     MOVE_POINT_MODE = enum.auto()
     ERASE_POINT_MODE = enum.auto()
+    WINDOW_MODE = enum.auto()
@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import cv2
+import math
+from module import utils, voi
+from module.config import config
+from module.frames import DicomFrames, get_dcm_frames_with_info
+from module.voi import VoiWindow
+import numpy
+import os
+from pydicom.encaps import generate_pixel_data_frame
+from PyQt5.QtCore import QSize, Qt
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+
+jpeg_exts = ('.jpg', '.jpeg', '.jpe')
+
+# baseline and extended JPEG, which libjpeg decodes at 1/8 of the size
+jpeg_syntaxes = ('1.2.840.10008.1.2.4.50', '1.2.840.10008.1.2.4.51')
+
+
+class DecodedImage:
+    """
+    what showing an image needs: its 8 bit pixels, the frames of a DICOM with the window of the first one decoded,
+    the patient info and the pixel spacing, mat is None if the image can't be decoded
+
+    the mat of a DICOM is the level of the window the view shows first, the levels up to it are windowed already
+    """
+
+    def __init__(
+            self, mat: Optional[numpy.ndarray], frames: Optional[DicomFrames] = None, md_info: str = '',
+            pixel_spacing: Optional[Tuple[float, float]] = None
+    ):
+        self.mat = mat
+        self.frames = frames
+        self.md_info = md_info
+        self.pixel_spacing = pixel_spacing
+
+    def get_bytes(self):
+        if self.frames:
+            return self.frames.get_bytes()
+        return self.mat.nbytes if self.mat is not None else 0
+
+
+# the level of the pyramid an image of shape fitted in view_size is drawn from, the full size without a view
+def get_view_level(shape: Tuple[int, ...], view_size: Optional[Tuple[int, int]]):
+    if not view_size:
+        return 0
+    width = QSize(shape[1], shape[0]).scaled(QSize(*view_size), Qt.KeepAspectRatio).width()
+    return voi.get_level_index(shape, width)
+
+
+# the pixels of a mapped DICOM are read here, not on the first paint
+def decode_img(path: str, view_size: Optional[Tuple[int, int]] = None):
+    if utils.is_dcm_path(path):
+        frames, md_info, pixel_spacing = get_dcm_frames_with_info(path)
+        window = frames.get_voi(0)
+        level = get_view_level(window.raw.shape, view_size)
+        # the full size is windowed only if it is the one shown
+        for index in range(min(level, 1), level + 1):
+            window.get_mat(index)
+        return DecodedImage(window.mats[level], frames, md_info, pixel_spacing)
+    return DecodedImage(utils.load_img_mat(path))
+
+
+# the first frame of a DICOM stored as JPEG decoded at 1/8 of the size, None for 12 bit JPEG
+def decode_dcm_jpeg_preview(dcm):
+    frame = next(generate_pixel_data_frame(dcm.PixelData, int(getattr(dcm, 'NumberOfFrames', 1) or 1)))
+    return cv2.imdecode(numpy.frombuffer(frame, numpy.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+
+# every step-th row and column of the first frame, read through the mapping, or None
+def decode_dcm_preview(path: str, size: int):
+    dcm, raw = utils.map_dcm_pixels(path)
+    if raw is not None:
+        raw = raw[0] if raw.ndim == 3 else raw
+        if (step := math.ceil(max(raw.shape) / size)) < 2:
+            return None
+        raw = numpy.ascontiguousarray(raw[::step, ::step])
+    elif dcm.file_meta.TransferSyntaxUID in jpeg_syntaxes:
+        raw = decode_dcm_jpeg_preview(dcm)
+    if raw is None:
+        return None
+    return VoiWindow(dcm, raw).get_mat()
+
+
+# a smaller image to show while a large one is decoded, None if there's no quicker way to it than decoding
+def decode_preview(path: str, size: int = config.preview_size, min_bytes: int = config.preview_min_bytes):
+    if os.path.getsize(path) < min_bytes:
+        return None
+    if utils.is_dcm_path(path):
+        return decode_dcm_preview(path, size)
+    if os.path.splitext(path)[1].lower() in jpeg_exts:
+        return cv2.imdecode(
+            numpy.fromfile(path, numpy.uint8), cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION
+        )
+    return None
+
+
+# a file written again is decoded again
+def get_img_key(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+class ImageCache:
+    """
+    decoded images by key, the least recently used ones are dropped beyond max_bytes
+
+    the bytes of an image are counted when it is put, the levels of a window halved later aren't
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.imgs: OrderedDict = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key: tuple) -> Optional[DecodedImage]:
+        if (item := self.imgs.get(key)) is None:
+            return None
+        self.imgs.move_to_end(key)
+        return item[0]
+
+    def put(self, key: tuple, img: DecodedImage):
+        if (old := self.imgs.pop(key, None)) is not None:
+            self.bytes -= old[1]
+        size = img.get_bytes()
+        self.imgs[key] = img, size
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self.imgs) > 1:
+            self.bytes -= self.imgs.popitem(last=False)[1][1]
+
+    def clear(self):
+        self.imgs.clear()
+        self.bytes = 0
+
+
+class Prefetcher:
+    """
+    decodes the images likely to be opened next on a thread pool into an ImageCache
+
+    get waits for an image being decoded instead of decoding it twice, DICOM are windowed for the view of view_size
+    """
+
+    def __init__(self, workers: int = 2, max_bytes: int = 1 << 30):
+        self.pool = ThreadPoolExecutor(workers)
+        self.cache = ImageCache(max_bytes)
+        self.pending: Dict[tuple, Future] = {}
+        self.lock = threading.Lock()
+        self.view_size: Optional[Tuple[int, int]] = None
+
+    def decode(self, key: tuple):
+        img = decode_img(key[0], self.view_size)
+        with self.lock:
+            self.cache.put(key, img)
+        return img
+
+    def submit(self, path: str) -> Future:
+        key = get_img_key(path)
+        with self.lock:
+            if (img := self.cache.get(key)) is not None:
+                future = Future()
+                future.set_result(img)
+                return future
+            if (future := self.pending.get(key)) is None:
+                future = self.pending[key] = self.pool.submit(self.decode, key)
+                future.add_done_callback(lambda _: self.forget(key))
+            return future
+
+    # a failed decoding is tried again next time
+    def forget(self, key: tuple):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def prefetch(self, paths: Iterable[str]):
+        for path in paths:
+            self.submit(path)
+
+    def get(self, path: str) -> DecodedImage:
+        return self.submit(path).result()
+
+    def shutdown(self):
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.cache.clear()
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from module import utils
+from module.voi import VoiWindow
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+from typing import Hashable, List, Optional
+
+
+class ImagePyramid:
+    """
+    the source and its successive halvings, each level is built on first use
+    """
+
+    def __init__(self, src: QImage):
+        self.levels: List[QImage] = [src]
+
+    # the smallest level at least width wide, with its index
+    def get_level(self, width: int):
+        index = 0
+        while self.levels[index].width() // 2 >= max(width, 1) and self.levels[index].height() // 2 >= 1:
+            if index + 1 == len(self.levels):
+                self.levels.append(self.get_half(self.levels[index]))
+            index += 1
+        return index, self.levels[index]
+
+    def get_half(self, img: QImage):
+        return img.scaled(img.width() // 2, img.height() // 2, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    # the source was changed in place, the halvings are built again on use
+    def reset(self):
+        del self.levels[1:]
+
+
+class WindowPyramid(ImagePyramid):
+    """
+    the levels of a DICOM window, halved in raw values and windowed in place only when used
+    """
+
+    def __init__(self, src: QImage, voi: VoiWindow):
+        super().__init__(src)
+        self.voi = voi
+
+    def get_level(self, width: int):
+        index, img = super().get_level(width)
+        self.voi.get_mat(index)
+        return index, img
+
+    def get_half(self, img: QImage):
+        return utils.get_qimage(self.voi.get_mat(len(self.levels)))
+
+    # the levels share the memory of the window, which marks what to look up again
+    def reset(self):
+        pass
+
+
+class TileCache:
+    """
+    scaled tiles, the least recently used ones are dropped beyond max_bytes
+    """
+
+    def __init__(self, max_bytes: int = 128 << 20):
+        self.max_bytes = max_bytes
+        self.tiles: OrderedDict = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key: Hashable) -> Optional[QPixmap]:
+        if (tile := self.tiles.get(key)) is not None:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key: Hashable, tile: QPixmap):
+        if (old := self.tiles.pop(key, None)) is not None:
+            self.bytes -= get_pixmap_bytes(old)
+        self.tiles[key] = tile
+        self.bytes += get_pixmap_bytes(tile)
+        while self.bytes > self.max_bytes and len(self.tiles) > 1:
+            self.bytes -= get_pixmap_bytes(self.tiles.popitem(last=False)[1])
+
+    def clear(self):
+        self.tiles.clear()
+        self.bytes = 0
+
+
+def get_pixmap_bytes(pixmap: QPixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
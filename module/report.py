@@ -0,0 +1,186 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import importlib.util
+from module import utils
+from module.annotation import LabelArrays
+from module.frames import strip_frame_suffix
+import os
+from pydicom import dcmread
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+
+columns = ('json', 'dcm', 'kind', 'a', 'b', 'c', 'value', 'unit')
+pivots_suffix = '_pivots'
+
+
+def walk_json_paths(root: str) -> Iterator[str]:
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1].lower() == '.json':
+                yield os.path.join(dir_path, file_name)
+
+
+# <root>/a/b.json or <root>/a/b_pivots.json -> <dcm_root>/a/b.dcm, next to the JSON if dcm_root is None,
+# and the ones of a frame, <root>/a/b_frame3.json ..., -> b.dcm too unless b_frame3.dcm is there
+def get_dcm_path(json_path: str, root: str, dcm_root: Optional[str]):
+    stem = os.path.splitext(json_path)[0]
+    if stem.endswith(pivots_suffix):
+        stem = stem[:-len(pivots_suffix)]
+    if dcm_root:
+        stem = os.path.join(dcm_root, os.path.relpath(stem, root))
+    if not os.path.isfile(stem + '.dcm'):
+        stem = strip_frame_suffix(stem)
+    return stem + '.dcm'
+
+
+def get_pixel_spacing(dcm_path: str) -> Optional[Tuple[float, float]]:
+    dcm = dcmread(dcm_path, stop_before_pixels=True, specific_tags=['PixelSpacing'])
+    return (float(dcm.PixelSpacing[0]), float(dcm.PixelSpacing[1])) if hasattr(dcm, 'PixelSpacing') else None
+
+
+# every distance, angle and circle radius of one JSON as rows of columns, unrounded,
+# with pixel spacing applied as in LabelApp.get_distance_text
+def measure(json_path: str, dcm_path: str) -> List[tuple]:
+    arrays = LabelArrays.from_json(utils.load_from_json(json_path))
+    if not os.path.isfile(dcm_path):
+        dcm_path = ''
+    pixel_spacing = get_pixel_spacing(dcm_path) if dcm_path else None
+    unit = 'mm' if pixel_spacing else 'px'
+    rows = []
+    for (a, b), value in zip(arrays.lines.tolist(), arrays.get_line_lengths(pixel_spacing).tolist()):
+        rows.append((json_path, dcm_path, 'line', a, b, None, value, unit))
+    for (a, b, c), value in zip(arrays.angles.tolist(), arrays.get_angle_degrees().tolist()):
+        rows.append((json_path, dcm_path, 'angle', a, b, c, value, 'deg'))
+    for (a, b), value in zip(arrays.circles.tolist(), arrays.get_circle_radii(pixel_spacing).tolist()):
+        rows.append((json_path, dcm_path, 'circle', a, b, None, value, unit))
+    return rows
+
+
+def measure_or_fail(paths: Tuple[str, str]):
+    try:
+        return paths[0], measure(*paths), None
+    except Exception as err:
+        return paths[0], [], str(err)
+
+
+class CsvWriter:
+    def __init__(self, path: str):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    rows are buffered into row groups of group_size
+    """
+
+    def __init__(self, path: str, group_size: int = 1 << 16):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ('json', pyarrow.string()), ('dcm', pyarrow.string()), ('kind', pyarrow.string()),
+            ('a', pyarrow.int64()), ('b', pyarrow.int64()), ('c', pyarrow.int64()),
+            ('value', pyarrow.float64()), ('unit', pyarrow.string())
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.group_size = group_size
+        self.rows: List[tuple] = []
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pyarrow.Table.from_arrays(
+                [self.pyarrow.array(column, type=field.type) for column, field in zip(zip(*self.rows), self.schema)],
+                schema=self.schema
+            ))
+            self.rows = []
+
+    def write(self, rows: List[tuple]):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.group_size:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def is_parquet(path: str):
+    return os.path.splitext(path)[1].lower() == '.parquet'
+
+
+def get_writer(path: str):
+    return ParquetWriter(path) if is_parquet(path) else CsvWriter(path)
+
+
+class Report:
+    """
+    measures the JSON files under root on a process pool and writes the rows in the order of the files
+    """
+
+    def __init__(self, root: str, dcm_root: Optional[str] = None, workers: int = 4, chunk_size: int = 64):
+        self.root = root
+        self.dcm_root = dcm_root
+        self.workers = max(workers, 1)
+        self.chunk_size = max(chunk_size, 1)
+        self.done = 0
+        self.rows = 0
+        self.failed: List[Tuple[str, str]] = []
+
+    def get_paths(self):
+        for json_path in walk_json_paths(self.root):
+            yield json_path, get_dcm_path(json_path, self.root, self.dcm_root)
+
+    def run(self, out_path: str):
+        writer = get_writer(out_path)
+        try:
+            with ProcessPoolExecutor(self.workers) as pool:
+                for json_path, rows, err in pool.map(measure_or_fail, self.get_paths(), chunksize=self.chunk_size):
+                    if err is not None:
+                        self.failed.append((json_path, err))
+                        print(f'{json_path}: {err}', file=sys.stderr)
+                        continue
+                    writer.write(rows)
+                    self.done += 1
+                    self.rows += len(rows)
+        finally:
+            writer.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m module.report',
+        description='measure every line, angle and circle of the label JSON files under a directory'
+    )
+    parser.add_argument('root', help='directory to walk')
+    parser.add_argument('-o', '--out', default='report.csv', help='.csv, or .parquet (needs pyarrow)')
+    parser.add_argument('-d', '--dcm-dir', help='mirror of root holding the DICOM files, default: next to the JSON')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='size of the process pool')
+    parser.add_argument('-c', '--chunk-size', type=int, default=64, help='JSON files per task')
+    args = parser.parse_args(argv)
+    if is_parquet(args.out) and importlib.util.find_spec('pyarrow') is None:
+        parser.error('writing .parquet needs pyarrow')
+
+    report = Report(args.root, args.dcm_dir, args.workers, args.chunk_size)
+    begin = time.perf_counter()
+    report.run(args.out)
+    print(
+        f'{report.rows} rows from {report.done} files, {len(report.failed)} failed '
+        f'in {time.perf_counter() - begin:.1f}s'
+    )
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
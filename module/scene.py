@@ -0,0 +1,89 @@
+from module.annotation import Erased
+from module.items import AngleItem, CircleItem, LineItem, PointItem, TiledImageItem
+from module.pyramid import ImagePyramid, WindowPyramid
+from module.voi import VoiWindow
+from PyQt5.QtCore import QObject
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QGraphicsItem, QGraphicsScene
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+class LabelScene(QGraphicsScene):
+    """
+    the image and one item per annotation in source coordinates, kept across events and updated in place
+
+    points < lines < angles < circles from bottom to top, as they used to be painted
+    """
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        # labels are children of the image, clipped by it as when they were painted onto it
+        self.img_item = TiledImageItem()
+        self.img_item.setFlag(QGraphicsItem.ItemClipsChildrenToShape)
+        self.addItem(self.img_item)
+        self.src: Optional[QImage] = None
+        self.zoom = 1
+        self.points: Dict[int, PointItem] = {}
+        self.lines: Dict[Tuple[int, int], LineItem] = {}
+        self.angles: Dict[Tuple[int, int, int], AngleItem] = {}
+        self.circles: Dict[Tuple[int, int], CircleItem] = {}
+
+    # the pyramid is rebuilt only for a new source, zoom is the scale of the view, voi windows a DICOM source
+    def set_img(self, src: Optional[QImage], zoom: float, voi: Optional[VoiWindow] = None):
+        if src is not self.src:
+            self.src = src
+            self.img_item.set_pyramid((WindowPyramid(src, voi) if voi else ImagePyramid(src)) if src else None)
+            # labels near the border don't grow the scrollable area
+            self.setSceneRect(self.img_item.boundingRect())
+        if zoom != self.zoom:
+            self.zoom = zoom
+            self.img_item.set_zoom(zoom)
+            for items in (self.lines, self.angles, self.circles):
+                for item in items.values():
+                    item.set_zoom(zoom)
+
+    def update_pixels(self):
+        self.img_item.reset_pixels()
+
+    def get_item(self, items: Dict, key: Hashable, new_item: Callable[[], QGraphicsItem], z: int):
+        if (item := items.get(key)) is None:
+            item = items[key] = new_item()
+            item.setZValue(z)
+            item.set_zoom(self.zoom)
+            item.setParentItem(self.img_item)
+        return item
+
+    def get_point(self, index: int) -> PointItem:
+        return self.get_item(self.points, index, PointItem, 1)
+
+    def get_line(self, key: Tuple[int, int]) -> LineItem:
+        return self.get_item(self.lines, key, LineItem, 2)
+
+    def get_angle(self, key: Tuple[int, int, int]) -> AngleItem:
+        return self.get_item(self.angles, key, AngleItem, 3)
+
+    def get_circle(self, key: Tuple[int, int]) -> CircleItem:
+        return self.get_item(self.circles, key, CircleItem, 4)
+
+    def remove_items(self, items: Dict, keys: Iterable):
+        for key in [key for key in items if key not in keys]:
+            self.removeItem(items.pop(key))
+
+    # drop the items of erased annotations
+    def retain(self, points: Iterable, lines: Iterable, angles: Iterable, circles: Iterable):
+        self.remove_items(self.points, points)
+        self.remove_items(self.lines, lines)
+        self.remove_items(self.angles, angles)
+        self.remove_items(self.circles, circles)
+
+    def remove_erased(self, erased: Erased):
+        for items, keys in (
+                (self.points, erased.points), (self.lines, erased.lines), (self.angles, erased.angles),
+                (self.circles, erased.circles)
+        ):
+            for key in keys:
+                if (item := items.pop(key, None)) is not None:
+                    self.removeItem(item)
+
+    def clear_labels(self):
+        self.retain((), (), (), ())
@@ -0,0 +1,171 @@
+from collections import defaultdict
+import math
+from PyQt5.QtCore import QPointF
+from typing import Dict, Hashable, Iterable, Optional, Set, Tuple
+
+
+Cell = Tuple[int, int]
+
+
+class Grid:
+    """
+    keys bucketed by the cells of a uniform grid they cover
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: Dict[Cell, Set[Hashable]] = defaultdict(set)
+        self.keys: Dict[Hashable, Tuple[Cell, ...]] = {}
+
+    def get_cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def get_box_cells(self, x0: float, y0: float, x1: float, y1: float):
+        cx0, cy0 = self.get_cell(x0, y0)
+        cx1, cy1 = self.get_cell(x1, y1)
+        return [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+
+    # the cells crossed by ab, column by column
+    def get_segment_cells(self, ax: float, ay: float, bx: float, by: float):
+        if ax > bx:
+            ax, ay, bx, by = bx, by, ax, ay
+        cells = []
+        cx0 = self.get_cell(ax, ay)[0]
+        cx1 = self.get_cell(bx, by)[0]
+        for cx in range(cx0, cx1 + 1):
+            if bx - ax < 1e-9:
+                y0, y1 = ay, by
+            else:
+                xl = max(ax, cx * self.cell_size)
+                xr = min(bx, (cx + 1) * self.cell_size)
+                y0 = ay + (by - ay) * (xl - ax) / (bx - ax)
+                y1 = ay + (by - ay) * (xr - ax) / (bx - ax)
+            cy0 = math.floor(min(y0, y1) / self.cell_size)
+            cy1 = math.floor(max(y0, y1) / self.cell_size)
+            cells.extend((cx, cy) for cy in range(cy0, cy1 + 1))
+        return cells
+
+    # the cells touched by the outline of a circle
+    def get_ring_cells(self, x: float, y: float, r: float):
+        cells = []
+        for cx, cy in self.get_box_cells(x - r, y - r, x + r, y + r):
+            left = cx * self.cell_size
+            top = cy * self.cell_size
+            right = left + self.cell_size
+            bottom = top + self.cell_size
+            near = math.hypot(max(left - x, 0, x - right), max(top - y, 0, y - bottom))
+            far = math.hypot(max(x - left, right - x), max(y - top, bottom - y))
+            if near <= r <= far:
+                cells.append((cx, cy))
+        return cells
+
+    def insert(self, key: Hashable, cells: Iterable[Cell]):
+        self.remove(key)
+        cells = tuple(cells)
+        self.keys[key] = cells
+        for cell in cells:
+            self.cells[cell].add(key)
+
+    def remove(self, key: Hashable):
+        for cell in self.keys.pop(key, ()):
+            bucket = self.cells[cell]
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, x: float, y: float, radius: float):
+        keys = set()
+        for cell in self.get_box_cells(x - radius, y - radius, x + radius, y + radius):
+            if bucket := self.cells.get(cell):
+                keys.update(bucket)
+        return keys
+
+    def clear(self):
+        self.cells.clear()
+        self.keys.clear()
+
+
+def get_segment_distance(x: float, y: float, ax: float, ay: float, bx: float, by: float):
+    dx = bx - ax
+    dy = by - ay
+    length = dx * dx + dy * dy
+    t = 0 if length < 1e-18 else min(max(((x - ax) * dx + (y - ay) * dy) / length, 0), 1)
+    return math.hypot(x - ax - t * dx, y - ay - t * dy)
+
+
+class SpatialIndex:
+    """
+    points, lines and circles in source coordinates for hit-testing, maintained incrementally
+
+    queries return the nearest key closer than the distance, ties go to the smallest key
+    """
+
+    def __init__(self, cell_size: float = 64):
+        self.point_grid = Grid(cell_size)
+        self.line_grid = Grid(cell_size)
+        self.circle_grid = Grid(cell_size)
+        self.points: Dict[int, Tuple[float, float]] = {}
+        self.lines: Dict[Tuple[int, int], Tuple[float, float, float, float]] = {}
+        self.circles: Dict[Tuple[int, int], Tuple[float, float, float]] = {}
+
+    def set_point(self, index: int, point: QPointF):
+        self.points[index] = point.x(), point.y()
+        self.point_grid.insert(index, (self.point_grid.get_cell(point.x(), point.y()),))
+
+    def remove_point(self, index: int):
+        self.points.pop(index, None)
+        self.point_grid.remove(index)
+
+    def set_line(self, key: Tuple[int, int], a: QPointF, b: QPointF):
+        self.lines[key] = a.x(), a.y(), b.x(), b.y()
+        self.line_grid.insert(key, self.line_grid.get_segment_cells(*self.lines[key]))
+
+    def remove_line(self, key: Tuple[int, int]):
+        self.lines.pop(key, None)
+        self.line_grid.remove(key)
+
+    # ⊙a, r = ab
+    def set_circle(self, key: Tuple[int, int], a: QPointF, b: QPointF):
+        self.circles[key] = a.x(), a.y(), math.hypot(b.x() - a.x(), b.y() - a.y())
+        self.circle_grid.insert(key, self.circle_grid.get_ring_cells(*self.circles[key]))
+
+    def remove_circle(self, key: Tuple[int, int]):
+        self.circles.pop(key, None)
+        self.circle_grid.remove(key)
+
+    def clear(self):
+        for grid in (self.point_grid, self.line_grid, self.circle_grid):
+            grid.clear()
+        self.points.clear()
+        self.lines.clear()
+        self.circles.clear()
+
+    def get_point_index(self, point: QPointF, distance: float) -> Optional[int]:
+        x, y = point.x(), point.y()
+        return get_nearest(
+            self.point_grid.query(x, y, distance), distance,
+            lambda index: math.hypot(self.points[index][0] - x, self.points[index][1] - y)
+        )
+
+    def get_line_key(self, point: QPointF, distance: float) -> Optional[Tuple[int, int]]:
+        x, y = point.x(), point.y()
+        return get_nearest(
+            self.line_grid.query(x, y, distance), distance,
+            lambda key: get_segment_distance(x, y, *self.lines[key])
+        )
+
+    def get_circle_key(self, point: QPointF, distance: float) -> Optional[Tuple[int, int]]:
+        x, y = point.x(), point.y()
+        return get_nearest(
+            self.circle_grid.query(x, y, distance), distance,
+            lambda key: math.fabs(math.hypot(self.circles[key][0] - x, self.circles[key][1] - y) - self.circles[key][2])
+        )
+
+
+def get_nearest(keys: Iterable, distance: float, get_distance):
+    nearest = None
+    for key in keys:
+        if (dis := get_distance(key)) < distance or (dis == distance and nearest is not None and key < nearest):
+            distance = dis
+            nearest = key
+    return nearest
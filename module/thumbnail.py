@@ -0,0 +1,120 @@
+import cv2
+import glob
+from module import prefetch
+from module.config import config
+from module.frames import frame_suffix
+import numpy
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def get_default_thumbnail_path():
+    return os.path.join(os.path.expanduser('~'), '.label_dcm', 'thumbnails.sqlite')
+
+
+# the JSON files export_all and export_pivots propose for an image, or for a frame of it
+def is_labeled(path: str):
+    stem = os.path.splitext(path)[0]
+    if os.path.exists(stem + '.json') or os.path.exists(stem + '_pivots.json'):
+        return True
+    return bool(glob.glob(glob.escape(stem) + frame_suffix + '*.json'))
+
+
+# the stems is_labeled is true for in a dir, from one listing of it
+def get_labeled_stems(dir_path: str):
+    stems = set()
+    for name in os.listdir(dir_path):
+        stem, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+        stems.add(stem)
+        if stem.endswith('_pivots'):
+            stems.add(stem[:-len('_pivots')])
+        index = stem.find(frame_suffix)
+        while index >= 0:
+            stems.add(stem[:index])
+            index = stem.find(frame_suffix, index + 1)
+    return stems
+
+
+# the image, or the first frame of a DICOM, fitted in size x size, as the GUI opens it
+def decode_thumbnail(path: str, size: int) -> Optional[numpy.ndarray]:
+    if (mat := prefetch.decode_preview(path, size, 0)) is None:
+        mat = prefetch.decode_img(path, (size, size)).mat
+    if mat is None:
+        return None
+    ratio = size / max(mat.shape[:2])
+    if ratio >= 1:
+        return mat
+    return cv2.resize(
+        mat, (max(round(mat.shape[1] * ratio), 1), max(round(mat.shape[0] * ratio), 1)), interpolation=cv2.INTER_AREA
+    )
+
+
+class ThumbnailCache:
+    """
+    path -> PNG thumbnail, made again only when the mtime or size of the file changed
+
+    the least recently used entries are evicted beyond max_entries
+    """
+
+    def __init__(
+            self, path: Optional[str] = None, size: int = config.thumbnail_size,
+            max_entries: int = config.thumbnail_max_entries
+    ):
+        self.path = path or get_default_thumbnail_path()
+        self.size = size
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS thumbnails '
+                '(path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, thumbnail_size INTEGER, png BLOB, used REAL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS thumbnails_used ON thumbnails (used)')
+
+    def get(self, path: str, mtime: int, size: int) -> Optional[bytes]:
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                'SELECT png FROM thumbnails WHERE path = ? AND mtime = ? AND size = ? AND thumbnail_size = ?',
+                (path, mtime, size, self.size)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute('UPDATE thumbnails SET used = ? WHERE path = ?', (time.time(), path))
+        return row[0]
+
+    def put(self, path: str, mtime: int, size: int, png: bytes):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?)',
+                (path, mtime, size, self.size, png, time.time())
+            )
+            # counted in the file, which windows opened side by side share
+            count = self.conn.execute('SELECT COUNT(*) FROM thumbnails').fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM thumbnails WHERE path IN (SELECT path FROM thumbnails ORDER BY used LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+
+    # the PNG of the thumbnail of an image, from the cache or made and cached now, None if it can't be decoded
+    def load(self, path: str) -> Optional[bytes]:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        if (png := self.get(path, stat.st_mtime_ns, stat.st_size)) is not None:
+            return png
+        if (mat := decode_thumbnail(path, self.size)) is None:
+            return None
+        png = cv2.imencode('.png', mat)[1].tobytes()
+        self.put(path, stat.st_mtime_ns, stat.st_size, png)
+        return png
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,14 +1,16 @@
+import cv2
 import json
 import math
+from module import voi
 from module.config import config
 import numpy
 import os
-from PIL import Image
 from pydicom import dcmread, FileDataset
 from pydicom.dicomdir import DicomDir
+from pydicom.pixel_data_handlers.util import pixel_dtype
 from PyQt5.QtCore import QPointF, QRectF
-from PyQt5.QtGui import QPixmap
-from typing import Optional, Union
+from PyQt5.QtGui import QColor, QImage
+from typing import BinaryIO, Dict, Iterable, Optional, Tuple, Union
 
 
 def is_file_exists(path: str):
@@ -65,27 +67,136 @@ def to_age(age: Optional[str]):
         return num + '天'
 
 
-def get_dcm_img_with_info(path: str):
-    dcm = dcmread(path)
+# 16 bit -> 8 bit as the model was trained, by a table over the raw values without windowing
+def get_raw_mat(raw: numpy.ndarray):
+    low = numpy.min(raw)
+    upp = numpy.max(raw)
+    return voi.map_pixels(raw, lambda values: numpy.floor_divide(values, (upp - low + 1) / 256).astype(numpy.uint8))
 
-    # 16 bit -> 8 bit
-    low = numpy.min(dcm.pixel_array)
-    upp = numpy.max(dcm.pixel_array)
-    mat = numpy.floor_divide(dcm.pixel_array, (upp - low + 1) / 256)
 
-    img = Image.fromarray(mat.astype(numpy.uint8)).toqpixmap()
+# the shape of pixel_array
+def get_pixel_data_shape(dcm: FileDataset):
+    frames = int(getattr(dcm, 'NumberOfFrames', 1) or 1)
+    return (frames, dcm.Rows, dcm.Columns) if frames > 1 else (dcm.Rows, dcm.Columns)
+
+
+# the offset of the pixel data in file, read up to it, if the bytes there are the values pixel_array decodes:
+# 8, 16 or 32 bit gray values stored uncompressed in little endian
+def get_pixel_data_offset(dcm: FileDataset, file: BinaryIO) -> Optional[int]:
+    syntax = getattr(getattr(dcm, 'file_meta', None), 'TransferSyntaxUID', None)
+    if not syntax or syntax.is_compressed or syntax.is_deflated or not syntax.is_little_endian:
+        return None
+    if getattr(dcm, 'SamplesPerPixel', 1) != 1 or getattr(dcm, 'BitsAllocated', None) not in (8, 16, 32):
+        return None
+    begin = file.tell()
+    header = file.read(8 if syntax.is_implicit_VR else 12)
+    if len(header) < 8 or header[:4] != b'\xe0\x7f\x10\x00':
+        return None
+    length = int.from_bytes(header[-4:], 'little')
+    if length < int(numpy.prod(get_pixel_data_shape(dcm))) * dcm.BitsAllocated // 8:
+        return None
+    return begin + len(header)
+
+
+# the dataset of a DICOM without the pixel data and its pixels mapped from the file, so that they are paged in
+# from the disk as they are read, or the whole dataset and None if they can't be mapped
+def map_dcm_pixels(path: str) -> Tuple[FileDataset, Optional[numpy.ndarray]]:
+    with open(path, 'rb') as file:
+        dcm = dcmread(file, stop_before_pixels=True)
+        offset = get_pixel_data_offset(dcm, file)
+    if offset is None:
+        return dcmread(path), None
+    return dcm, numpy.memmap(path, pixel_dtype(dcm), 'r', offset, get_pixel_data_shape(dcm))
+
+
+# the pixels mapped, or decoded by pydicom
+def read_dcm_pixels(path: str) -> Tuple[FileDataset, numpy.ndarray]:
+    dcm, raw = map_dcm_pixels(path)
+    return dcm, dcm.pixel_array if raw is None else raw
+
+
+def get_dcm_mat(path: str):
+    return get_raw_mat(read_dcm_pixels(path)[1])
+
+
+# the attributes of the patient info
+dcm_info_names = (
+    'PatientID', 'PatientName', 'PatientBirthDate', 'PatientSex', 'PatientWeight', 'StudyDate', 'SeriesDate',
+    'PatientAge', 'BodyPartExamined'
+)
+
+
+def get_dcm_header(dcm: Union[FileDataset, DicomDir]):
+    return {name: get_attr(dcm, name) for name in dcm_info_names}
+
+
+def get_md_info(header: Dict[str, Optional[str]]):
     info = dict(
-        患者ID=get_attr(dcm, 'PatientID'), 姓名=get_attr(dcm, 'PatientName'),
-        出生日期=to_date(get_attr(dcm, 'PatientBirthDate')), 性别=to_sex(get_attr(dcm, 'PatientSex')),
-        体重=get_attr(dcm, 'PatientWeigh'), 检查开始日期=to_date(get_attr(dcm, 'StudyDate')),
-        检查日期=to_date(get_attr(dcm, 'SeriesDate')), 检查时患者年龄=to_age(get_attr(dcm, 'PatientAge')),
-        检查部位=get_attr(dcm, 'BodyPartExamined')
+        患者ID=header['PatientID'], 姓名=header['PatientName'],
+        出生日期=to_date(header['PatientBirthDate']), 性别=to_sex(header['PatientSex']),
+        体重=header['PatientWeight'], 检查开始日期=to_date(header['StudyDate']),
+        检查日期=to_date(header['SeriesDate']), 检查时患者年龄=to_age(header['PatientAge']),
+        检查部位=header['BodyPartExamined']
     )
     for attr in info.keys():
         if not info[attr]:
             info[attr] = '（不详）'
-    pixel_spacing = (dcm.PixelSpacing[0], dcm.PixelSpacing[1]) if hasattr(dcm, 'PixelSpacing') else None
-    return img, '---\n\n'.join([f'{key}: {val}\n\n' for key, val in info.items()]), pixel_spacing
+    return '---\n\n'.join([f'{key}: {val}\n\n' for key, val in info.items()])
+
+
+def get_dcm_pixel_spacing(dcm: FileDataset) -> Optional[Tuple[float, float]]:
+    return (dcm.PixelSpacing[0], dcm.PixelSpacing[1]) if hasattr(dcm, 'PixelSpacing') else None
+
+
+def get_dcm_info(dcm: FileDataset):
+    return get_md_info(get_dcm_header(dcm)), get_dcm_pixel_spacing(dcm)
+
+
+img_exts = ('.dcm', '.jpg', '.jpeg', '.jpe', '.png')
+
+
+def is_img_path(path: str):
+    return os.path.splitext(path)[1].lower() in img_exts
+
+
+# the images directly in a directory, sorted by name
+def get_img_paths(img_dir: str):
+    try:
+        file_names = sorted(os.listdir(img_dir))
+    except OSError:
+        return []
+    return [os.path.join(img_dir, file_name) for file_name in file_names
+            if is_img_path(file_name) and os.path.isfile(os.path.join(img_dir, file_name))]
+
+
+def is_dcm_path(path: str):
+    return os.path.splitext(path)[1].lower() == '.dcm'
+
+
+# BGR as the model takes it, gray is repeated into 3 channels without a copy
+def get_bgr_view(mat: numpy.ndarray):
+    if mat.ndim == 2:
+        return numpy.broadcast_to(mat[..., numpy.newaxis], mat.shape + (3,))
+    return mat
+
+
+def load_cv2_img(path: str):
+    if is_dcm_path(path):
+        return get_bgr_view(get_dcm_mat(path))
+
+    # cv2.imread can't open non-ascii paths on windows
+    return cv2.imdecode(numpy.fromfile(path, numpy.uint8), cv2.IMREAD_COLOR)
+
+
+# BGR as QPixmap.load shows it, the EXIF orientation isn't applied
+def load_img_mat(path: str) -> Optional[numpy.ndarray]:
+    return cv2.imdecode(numpy.fromfile(path, numpy.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+
+
+# gray or BGR, the QImage shares the memory of mat, which must outlive it
+def get_qimage(mat: numpy.ndarray):
+    img_format = QImage.Format_Grayscale8 if mat.ndim == 2 else QImage.Format_BGR888
+    return QImage(mat.data, mat.shape[1], mat.shape[0], mat.strides[0], img_format)
 
 
 def rename_path_ext(path: str, ext: str):
@@ -117,6 +228,15 @@ def save_json_file(data: dict, path: str):
         json.dump(data, file, indent=config.indent)
 
 
+# the same layout as LabelApp.export_all, every point is a pivot
+def get_pivots_labels(points: Iterable[Tuple[float, float]], color: str = config.default_color):
+    data = dict(points=[], lines=[], angles=[], circles=[], pivots=[])
+    for index, (x, y) in enumerate(points, 1):
+        data['points'].append((index, float(x), float(y), QColor(color).name()))
+        data['pivots'].append(index)
+    return data
+
+
 def get_index_shift(a: QPointF):
     return QPointF(a.x() + config.index_shifting, a.y() - config.index_shifting)
 
@@ -247,12 +367,3 @@ def get_foot_point(a: QPointF, b: QPointF, c: QPointF):
 
 def is_on_segment(a: QPointF, b: QPointF, c: QPointF):
     return min(a.x(), b.x()) < c.x() + config.eps and c.x() < max(a.x(), b.x()) + config.eps
-
-
-def get_cv2_img(pixmap: QPixmap):
-    img = pixmap.toImage()
-    shape = (img.height(), img.bytesPerLine() * 8 // img.depth(), 4)
-    ptr = img.bits()
-    ptr.setsize(img.byteCount())
-    cv2_img = numpy.array(ptr, numpy.uint8).reshape(shape)
-    return cv2_img[..., :3]
@@ -0,0 +1,143 @@
+import cv2
+import numpy
+from pydicom import FileDataset
+from pydicom.multival import MultiValue
+from typing import Callable, List, Optional, Tuple
+
+
+chunk_rows = 256
+
+
+# the raw values as indexes of a table: 8 or 16 bit integers, signed ones by their bit pattern
+def get_lut_keys(raw: numpy.ndarray) -> Optional[numpy.ndarray]:
+    if raw.dtype.kind not in 'iu' or raw.dtype.itemsize > 2:
+        return None
+    return raw.view(numpy.dtype(f'u{raw.dtype.itemsize}'))
+
+
+# the raw value of every entry of the table
+def get_lut_values(raw: numpy.ndarray):
+    return numpy.arange(1 << 8 * raw.dtype.itemsize, dtype=numpy.dtype(f'u{raw.dtype.itemsize}')).view(raw.dtype)
+
+
+# lut[keys] into out, a band of rows at a time to keep the indexes small
+def apply_lut(keys: numpy.ndarray, lut: numpy.ndarray, out: Optional[numpy.ndarray] = None):
+    if out is None:
+        out = numpy.empty(keys.shape, lut.dtype)
+    for begin in range(0, len(keys), chunk_rows):
+        numpy.take(lut, keys[begin:begin + chunk_rows], out=out[begin:begin + chunk_rows])
+    return out
+
+
+# map_values(raw) through a table over every raw value when there are at most 2 ** 16 of them
+def map_pixels(
+        raw: numpy.ndarray, map_values: Callable[[numpy.ndarray], numpy.ndarray], out: Optional[numpy.ndarray] = None
+):
+    if (keys := get_lut_keys(raw)) is None:
+        mat = map_values(raw)
+        if out is None:
+            return mat
+        out[...] = mat
+        return out
+    return apply_lut(keys, map_values(get_lut_values(raw)), out)
+
+
+# the linear VOI function of DICOM PS3.3 C.11.2.1.2.1 to 8 bits
+def get_window_values(values: numpy.ndarray, center: float, width: float, inverted: bool = False):
+    ratio = numpy.clip((values - (center - 0.5)) / max(width - 1, 1e-5) + 0.5, 0, 1)
+    mat = numpy.rint(ratio * 255).astype(numpy.uint8)
+    return 255 - mat if inverted else mat
+
+
+# WindowCenter / WindowWidth may hold several windows, the first one is the default
+def get_first(value):
+    return float(value[0]) if isinstance(value, MultiValue) else float(value)
+
+
+# 2 x 2 means, the size of QImage.scaled to the half
+def get_half(raw: numpy.ndarray):
+    height, width = raw.shape[0] // 2, raw.shape[1] // 2
+    if raw.dtype in (numpy.uint8, numpy.uint16, numpy.int16, numpy.float32):
+        return cv2.resize(raw[:2 * height, :2 * width], (width, height), interpolation=cv2.INTER_AREA)
+    mean = raw[:2 * height, :2 * width].reshape(height, 2, width, 2).mean(axis=(1, 3))
+    return (numpy.rint(mean) if raw.dtype.kind in 'iu' else mean).astype(raw.dtype)
+
+
+# the index of the level ImagePyramid.get_level picks for width, counted from the full size
+def get_level_index(shape: Tuple[int, ...], width: int):
+    height, full_width = shape[:2]
+    index = 0
+    while full_width // 2 >= max(width, 1) and height // 2 >= 1:
+        height, full_width = height // 2, full_width // 2
+        index += 1
+    return index
+
+
+class VoiWindow:
+    """
+    the raw pixels of a DICOM and the 8 bits shown of them, at full size and successive halvings
+
+    the modality rescale, the window of center / width and the inversion of MONOCHROME1 are folded into one table
+    over every raw value, so that moving the window is a table lookup per pixel, written in place into the level
+    shown; the other levels, the full size included, are looked up when they are next used
+    """
+
+    def __init__(self, dcm: FileDataset, raw: Optional[numpy.ndarray] = None):
+        self.raw: numpy.ndarray = dcm.pixel_array if raw is None else raw
+        self.slope = float(getattr(dcm, 'RescaleSlope', 1) or 1)
+        self.intercept = float(getattr(dcm, 'RescaleIntercept', 0) or 0)
+        self.inverted = getattr(dcm, 'PhotometricInterpretation', '') == 'MONOCHROME1'
+        low, upp = sorted(self.get_modality_values(numpy.array([numpy.min(self.raw), numpy.max(self.raw)], float)))
+        self.range: Tuple[float, float] = (float(low), float(upp))
+        low, upp = self.range
+        if hasattr(dcm, 'WindowCenter') and hasattr(dcm, 'WindowWidth'):
+            self.default = get_first(dcm.WindowCenter), max(get_first(dcm.WindowWidth), 1)
+        else:
+            self.default = (low + upp) / 2, upp - low + 1
+        self.center, self.width = self.default
+        self.raws: List[numpy.ndarray] = [self.raw]
+        self.mats: List[numpy.ndarray] = [numpy.empty(self.raw.shape, numpy.uint8)]
+        self.fresh: List[bool] = [False]
+
+    def get_modality_values(self, values: numpy.ndarray):
+        return values * self.slope + self.intercept
+
+    def get_values(self, values: numpy.ndarray):
+        return get_window_values(self.get_modality_values(values), self.center, self.width, self.inverted)
+
+    # the level halved index times, as the window is now
+    def get_mat(self, index: int = 0):
+        while len(self.raws) <= index:
+            self.raws.append(get_half(self.raws[-1]))
+            self.mats.append(numpy.empty(self.raws[-1].shape, numpy.uint8))
+            self.fresh.append(False)
+        if not self.fresh[index]:
+            map_pixels(self.raws[index], self.get_values, self.mats[index])
+            self.fresh[index] = True
+        return self.mats[index]
+
+    # the span of the values, a window wider than twice it or centered further away shows nothing new
+    def get_span(self):
+        return self.range[1] - self.range[0] + 1
+
+    def move(self, center: float, width: float):
+        if (center, width) == (self.center, self.width):
+            return False
+        self.center = center
+        self.width = width
+        self.fresh = [False] * len(self.fresh)
+        return True
+
+    def set_window(self, center: float, width: float):
+        span = self.get_span()
+        return self.move(
+            min(max(center, self.range[0] - span), self.range[1] + span), min(max(width, 1), 2 * span)
+        )
+
+    def reset(self):
+        return self.move(*self.default)
+
+    # the raw pixels mapped from the file are paged out by the system
+    def get_bytes(self):
+        raws = [raw for raw in self.raws if not isinstance(raw, numpy.memmap)]
+        return sum(raw.nbytes for raw in raws) + sum(mat.nbytes for mat in self.mats)
@@ -0,0 +1,145 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from module import prefetch, utils
+from module.prefetch import Prefetcher
+from module.thumbnail import ThumbnailCache
+import numpy
+from PyQt5.QtCore import pyqtSignal, QObject, QThread
+from typing import List, Optional
+
+
+# import torch and load the model off the GUI thread
+class ModelLoader(QThread):
+    loaded = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            from model import test
+            test.get_model()
+        except Exception as err:
+            self.failed.emit(str(err))
+        else:
+            self.loaded.emit()
+
+
+# auto label one image off the GUI thread, check for cancellation between the stages
+# raw pixels of a DICOM are mapped over their range here too, as the model was trained on them whatever the window shown
+class AutoLabeler(QThread):
+    progress = pyqtSignal(int)
+    labeled = pyqtSignal(int, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, mat: numpy.ndarray, raw: bool, img_id: int, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.mat = mat
+        self.raw = raw
+        self.img_id = img_id
+
+        # isInterruptionRequested is always False once the thread has finished
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.requestInterruption()
+
+    def run(self):
+        try:
+            from model import test
+            from model.cache import get_img_hash
+            self.progress.emit(0)
+            img = utils.get_bgr_view(utils.get_raw_mat(self.mat) if self.raw else self.mat)
+            model = test.get_model()
+            cache = test.get_cache()
+            img_hash = get_img_hash(img)
+            if (cached := cache.get(img_hash)) is not None:
+                self.progress.emit(100)
+                self.labeled.emit(self.img_id, cached[0])
+                return None
+            if self.isInterruptionRequested():
+                return None
+            self.progress.emit(20)
+            input_map = test.normalize_image(img).unsqueeze(dim=0)
+            if self.isInterruptionRequested():
+                return None
+            self.progress.emit(40)
+            hm = test.get_heatmaps(model, input_map)
+            if self.isInterruptionRequested():
+                return None
+            self.progress.emit(80)
+            preds, maxvals = test.get_ori_preds_and_maxvals(hm, [img.shape[:2]])
+            cache.put(img_hash, preds[0], maxvals[0])
+            if self.isInterruptionRequested():
+                return None
+            self.progress.emit(100)
+            self.labeled.emit(self.img_id, preds[0])
+        except Exception as err:
+            self.failed.emit(str(err))
+
+
+# open an image on the threads of the prefetcher, signal a preview first if the image isn't decoded yet,
+# the signals come from other threads and are queued to the GUI thread
+class ImageOpener(QObject):
+    previewed = pyqtSignal(int, object)
+    opened = pyqtSignal(int, str, object)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, prefetcher: Prefetcher, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.prefetcher = prefetcher
+        self.preview_pool = ThreadPoolExecutor(1)
+
+    def open(self, img_id: int, path: str):
+        future = self.prefetcher.submit(path)
+        if not future.done():
+            self.preview_pool.submit(self.preview, img_id, path, future)
+        future.add_done_callback(lambda done: self.finish(img_id, path, done))
+
+    def preview(self, img_id: int, path: str, future: Future):
+        try:
+            mat = prefetch.decode_preview(path)
+        except Exception:
+            return None
+        if mat is not None and not future.done():
+            self.previewed.emit(img_id, mat)
+
+    def finish(self, img_id: int, path: str, future: Future):
+        if future.cancelled():
+            return None
+        if (err := future.exception()) is not None:
+            self.failed.emit(img_id, str(err))
+        else:
+            self.opened.emit(img_id, path, future.result())
+
+    def shutdown(self):
+        self.preview_pool.shutdown(wait=False)
+
+
+# the thumbnails of the images of a dir one by one off the GUI thread, the ones of an older generation are dropped
+class ThumbnailLoader(QObject):
+    loaded = pyqtSignal(int, str, object)
+
+    def __init__(self, cache: ThumbnailCache, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = ThreadPoolExecutor(1)
+        self.generation = 0
+
+    def load(self, generation: int, paths: List[str]):
+        self.generation = generation
+        self.pool.submit(self.run, generation, paths)
+
+    def run(self, generation: int, paths: List[str]):
+        for path in paths:
+            if generation != self.generation:
+                return None
+            try:
+                png = self.cache.load(path)
+            except Exception:
+                continue
+            if png is not None and generation == self.generation:
+                self.loaded.emit(generation, path, png)
+
+    def shutdown(self):
+        self.generation = -1
+        self.pool.shutdown(wait=False)
+        self.cache.close()
@@ -0,0 +1,87 @@
+from module.annotation import AnnotationStore
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QColor
+
+
+# 1 - 2 - 3 - 4 with ∠123, ∠234, ⊙1 r = 12, ⊙4 r = 43, and 2, 4 as pivots
+def get_store():
+    store = AnnotationStore()
+    for index in range(1, 5):
+        store.set_point(index, QPointF(index * 10, 0), QColor('red'))
+    for index in range(1, 4):
+        store.add_line(index, index + 1, QColor('green'))
+    store.add_angle(1, 2, 3, QColor('blue'))
+    store.add_angle(2, 3, 4, QColor('blue'))
+    store.add_circle(1, 2, QColor('yellow'))
+    store.add_circle(4, 3, QColor('yellow'))
+    store.pivots.update((2, 4))
+    return store
+
+
+def check_incident(store: AnnotationStore):
+    for incident, shapes in (
+            (store.point_lines, store.lines), (store.point_angles, store.angles), (store.point_circles, store.circles)
+    ):
+        assert {key for keys in incident.values() for key in keys} == set(shapes)
+        for index, keys in incident.items():
+            assert all(index in key for key in keys)
+
+
+def test_erase_point():
+    store = get_store()
+    erased = store.erase_point(2)
+    assert (erased.points, erased.lines, erased.angles, erased.circles) == (
+        {2}, {(1, 2), (2, 3)}, {(1, 2, 3), (2, 3, 4)}, {(1, 2)}
+    )
+    assert set(store.points) == {1, 3, 4}
+    assert set(store.lines) == {(3, 4)}
+    assert not store.angles
+    assert set(store.circles) == {(4, 3)}
+    assert store.pivots == {4}
+    check_incident(store)
+
+
+def test_erase_line_with_the_angles_on_it():
+    store = get_store()
+    erased = store.erase_line((1, 2))
+    assert (erased.points, erased.lines, erased.angles, erased.circles) == (set(), {(1, 2)}, {(1, 2, 3)}, set())
+    assert set(store.angles) == {(2, 3, 4)}
+    check_incident(store)
+    erased = store.erase_circle((4, 3))
+    assert erased.circles == {(4, 3)}
+    assert set(store.circles) == {(1, 2)}
+    check_incident(store)
+
+
+def test_rename_point():
+    store = get_store()
+    color = store.lines[(2, 3)]
+    erased = store.rename_point(3, 7)
+    assert (erased.points, erased.lines, erased.angles, erased.circles) == (
+        {3}, {(2, 3), (3, 4)}, {(1, 2, 3), (2, 3, 4)}, {(4, 3)}
+    )
+    assert set(store.points) == {1, 2, 4, 7}
+    assert set(store.lines) == {(1, 2), (2, 7), (4, 7)}
+    assert store.lines[(2, 7)] == color
+    assert set(store.angles) == {(1, 2, 7), (2, 7, 4)}
+    assert set(store.circles) == {(1, 2), (4, 7)}
+    check_incident(store)
+    store.rename_point(4, 5)
+    assert store.pivots == {2, 5}
+    check_incident(store)
+
+
+def test_new_index():
+    store = AnnotationStore()
+    assert store.get_new_index() == 1
+    store = get_store()
+    assert store.get_new_index() == 5
+    store.erase_point(4)
+    assert store.get_new_index() == 4
+    store.rename_point(3, 9)
+    assert store.get_new_index() == 10
+    store.erase_point(9)
+    store.set_point(2, QPointF(), QColor('red'))
+    assert store.get_new_index() == 3
+    store.clear()
+    assert store.get_new_index() == 1
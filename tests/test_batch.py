@@ -0,0 +1,79 @@
+import cv2
+from model import test
+from model.cache import PredictionCache
+from module import batch, utils
+import numpy
+import os
+import pytest
+import torch
+
+
+# peaks at fixed places of the heatmaps, counting the forward passes
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, input_map: torch.Tensor):
+        self.calls += 1
+        hm = torch.zeros(len(input_map), 3, 64, 128)
+        for joint in range(3):
+            hm[:, joint, 10 + joint * 10, 20 + joint * 30] = 1
+        return hm
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    model = FakeModel()
+    cache = PredictionCache('fake', str(tmp_path / 'predictions.sqlite'))
+    monkeypatch.setattr(test, 'get_model', lambda: model)
+    monkeypatch.setattr(test, 'get_cache', lambda: cache)
+    yield model
+    cache.close()
+
+
+def make_imgs(root: str, count: int):
+    os.makedirs(root)
+    rng = numpy.random.default_rng(0)
+    paths = [os.path.join(root, f'{index}.png') for index in range(count)]
+    for path in paths:
+        cv2.imwrite(path, rng.integers(0, 256, (48, 40, 3), dtype=numpy.uint8))
+    return paths
+
+
+def test_pipeline_labels_every_image(tmp_path, model):
+    paths = make_imgs(str(tmp_path / 'imgs'), 5)
+    pipeline = batch.Pipeline(str(tmp_path / 'imgs'), str(tmp_path / 'out'), workers=2, batch_size=2)
+    pipeline.run()
+    assert (pipeline.done, pipeline.skipped, pipeline.failed) == (5, 0, [])
+    assert model.calls == 3
+    for path in paths:
+        json_path = batch.get_json_path(path, str(tmp_path / 'imgs'), str(tmp_path / 'out'))
+        assert len(utils.load_from_json(json_path)['points']) == 3
+
+
+def test_pipeline_skips_existing(tmp_path, model):
+    make_imgs(str(tmp_path / 'imgs'), 4)
+    batch.Pipeline(str(tmp_path / 'imgs'), use_cache=False).run()
+    pipeline = batch.Pipeline(str(tmp_path / 'imgs'), skip_existing=True, use_cache=False)
+    pipeline.run()
+    assert (pipeline.done, pipeline.skipped, model.calls) == (0, 4, 1)
+
+
+# a rerun makes no forward pass, and collects the saves of the cached images as it goes
+def test_pipeline_reuses_cached_predictions(tmp_path, model, monkeypatch):
+    paths = make_imgs(str(tmp_path / 'imgs'), 12)
+    batch.Pipeline(str(tmp_path / 'imgs'), workers=2, batch_size=4).run()
+    labels = [utils.load_from_json(utils.rename_path_ext(path, '.json')) for path in paths]
+    pending = []
+    collect = batch.Pipeline.collect
+
+    def count_pending(self, saving, limit: int):
+        pending.append(len(saving))
+        collect(self, saving, limit)
+
+    monkeypatch.setattr(batch.Pipeline, 'collect', count_pending)
+    pipeline = batch.Pipeline(str(tmp_path / 'imgs'), workers=2, batch_size=4)
+    pipeline.run()
+    assert (pipeline.done, pipeline.failed, model.calls) == (12, [], 3)
+    assert max(pending) <= pipeline.workers + 1
+    assert [utils.load_from_json(utils.rename_path_ext(path, '.json')) for path in paths] == labels
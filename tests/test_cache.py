@@ -0,0 +1,62 @@
+from model.cache import get_img_hash, PredictionCache
+import numpy
+import pytest
+import time
+
+
+def get_preds(seed: int):
+    rng = numpy.random.default_rng(seed)
+    return rng.uniform(0, 500, (11, 2)), rng.uniform(0, 1, (11, 1))
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'predictions.sqlite')
+
+
+def test_get_returns_what_was_put(cache_path):
+    cache = PredictionCache('model', cache_path)
+    preds, maxvals = get_preds(0)
+    cache.put('img', preds, maxvals)
+    cached = cache.get('img')
+    numpy.testing.assert_array_equal(cached[0], preds)
+    numpy.testing.assert_array_equal(cached[1], maxvals)
+    assert cache.get('other') is None
+    cache.close()
+
+
+# engines sharing the file don't see each other's predictions
+def test_keyed_by_model(cache_path):
+    cache_a = PredictionCache('model a', cache_path)
+    cache_b = PredictionCache('model b', cache_path)
+    cache_a.put('img', *get_preds(0))
+    assert cache_b.get('img') is None
+    cache_b.put('img', *get_preds(1))
+    numpy.testing.assert_array_equal(cache_a.get('img')[0], get_preds(0)[0])
+    numpy.testing.assert_array_equal(cache_b.get('img')[0], get_preds(1)[0])
+    cache_a.close()
+    cache_b.close()
+
+
+def test_evicts_least_recently_used(cache_path):
+    cache = PredictionCache('model', cache_path, max_entries=3)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, *get_preds(0))
+        time.sleep(0.01)
+    # a is used again, b is now the least recently used
+    assert cache.get('a') is not None
+    time.sleep(0.01)
+    cache.put('d', *get_preds(0))
+    assert [key for key in 'abcd' if cache.get(key) is not None] == ['a', 'c', 'd']
+    cache.close()
+
+
+def test_img_hash():
+    mat = numpy.random.default_rng(0).integers(0, 256, (40, 30), dtype=numpy.uint8)
+    bgr = numpy.broadcast_to(mat[..., numpy.newaxis], mat.shape + (3,))
+    assert get_img_hash(bgr) == get_img_hash(numpy.broadcast_to(mat.copy()[..., numpy.newaxis], bgr.shape))
+    # a gray view, its copy, the gray mat and a different image are all apart
+    hashes = {get_img_hash(bgr), get_img_hash(numpy.ascontiguousarray(bgr)), get_img_hash(mat), get_img_hash(mat.T)}
+    assert len(hashes) == 4
+    # strided views are hashed as their copies
+    assert get_img_hash(mat[:, ::2]) == get_img_hash(numpy.ascontiguousarray(mat[:, ::2]))
@@ -0,0 +1,22 @@
+import importlib.util
+from model import export
+from model.engine import get_engine, load_unet
+import os
+import pytest
+
+
+weights_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'model_best.pth')
+
+
+@pytest.mark.skipif(not os.path.exists(weights_path), reason='needs static/model_best.pth')
+@pytest.mark.skipif(importlib.util.find_spec('onnxruntime') is None, reason='needs onnxruntime')
+def test_exported_engines_match_torch(tmp_path):
+    torchscript_path = str(tmp_path / 'model.pt')
+    onnx_path = str(tmp_path / 'model.onnx')
+    model = load_unet(weights_path)
+    export.export_torchscript(model, torchscript_path)
+    export.export_onnx(model, onnx_path)
+    assert export.check_parity(dict(
+        torch=get_engine('torch', weights_path), torchscript=get_engine('torchscript', torchscript_path),
+        onnx=get_engine('onnx', onnx_path)
+    ))
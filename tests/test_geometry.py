@@ -0,0 +1,78 @@
+from module import geometry, utils
+import numpy
+from PyQt5.QtCore import QPointF
+import pytest
+
+
+# random points, and points sharing an x or a y so that every case of the shifts is met
+def get_points(seed: int, count: int = 256):
+    rng = numpy.random.default_rng(seed)
+    return [rng.uniform(-500, 500, (count, 2)), rng.integers(-2, 3, (count, 2)).astype(numpy.float64) * 10]
+
+
+def to_qpoints(points: numpy.ndarray):
+    return [QPointF(x, y) for x, y in points.tolist()]
+
+
+def to_array(values):
+    return numpy.array([(value.x(), value.y()) if isinstance(value, QPointF) else value for value in values])
+
+
+def check(kernel, scalar, *points: numpy.ndarray, atol: float = 1e-9):
+    expected = to_array([scalar(*row) for row in zip(*map(to_qpoints, points))])
+    numpy.testing.assert_allclose(kernel(*points), expected, rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_two_point_kernels(seed: int):
+    for a, b in zip(get_points(seed), get_points(seed + 100)):
+        check(geometry.get_midpoints, utils.get_midpoint, a, b)
+        check(geometry.get_distances, utils.get_distance, a, b)
+        check(geometry.get_degree_shifts, utils.get_degree_shift, a, b)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_lengths(seed: int):
+    pixel_spacing = (0.14, 0.2)
+    for a, b in zip(get_points(seed), get_points(seed + 100)):
+        check(geometry.get_lengths, utils.get_distance, a, b)
+        numpy.testing.assert_allclose(
+            geometry.get_lengths(a, b, pixel_spacing),
+            geometry.get_distances(a * pixel_spacing, b * pixel_spacing), rtol=0, atol=1e-12
+        )
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_three_point_kernels(seed: int):
+    for a, b, c in zip(get_points(seed), get_points(seed + 100), get_points(seed + 200)):
+        check(geometry.get_distance_shifts, utils.get_distance_shift, a, b, c)
+        check(geometry.get_radii, utils.get_radius, a, b, c)
+        check(geometry.get_arc_midpoints, utils.get_arc_midpoint, a, b, c)
+        check(geometry.get_dots, utils.get_dot, a, b, c)
+        check(geometry.get_crosses, utils.get_cross, a, b, c)
+        # arccos of the vectorised and the scalar cosine, apart by an ulp, differ the most near 0 and 180 degrees
+        check(geometry.get_degrees, utils.get_degree, a, b, c, atol=1e-5)
+        check(geometry.get_begin_degrees, utils.get_begin_degree, a, b, c, atol=1e-5)
+
+
+# the corners of the rectangle of the arc
+@pytest.mark.parametrize('seed', range(3))
+def test_diag_points(seed: int):
+    for a, b, c in zip(get_points(seed), get_points(seed + 100), get_points(seed + 200)):
+        expected = zip(*[utils.get_diag_points(*row) for row in zip(to_qpoints(a), to_qpoints(b), to_qpoints(c))])
+        for corners, scalar_corners in zip(geometry.get_diag_points(a, b, c), expected):
+            numpy.testing.assert_allclose(corners, to_array(scalar_corners), rtol=0, atol=1e-9)
+
+
+# the foot is undefined for a == b, which the random points never meet
+@pytest.mark.parametrize('seed', range(3))
+def test_foot_points(seed: int):
+    a, b, c = get_points(seed)[0], get_points(seed + 100)[0], get_points(seed + 200)[0]
+    check(geometry.get_foot_points, utils.get_foot_point, a, b, c)
+
+
+def test_dis_points():
+    a, b = get_points(0)[0], get_points(1)[0]
+    dis = numpy.random.default_rng(2).uniform(0, 100, len(a))
+    expected = to_array([utils.get_dis_point(p, q, d) for p, q, d in zip(to_qpoints(a), to_qpoints(b), dis.tolist())])
+    numpy.testing.assert_allclose(geometry.get_dis_points(a, b, dis), expected, rtol=0, atol=1e-9)
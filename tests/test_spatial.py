@@ -0,0 +1,87 @@
+import math
+from module.spatial import get_segment_distance, SpatialIndex
+import numpy
+from PyQt5.QtCore import QPointF
+import pytest
+
+
+def get_shapes(seed: int, count: int = 60):
+    rng = numpy.random.default_rng(seed)
+    points = {index: QPointF(*rng.uniform(-300, 300, 2)) for index in range(1, count + 1)}
+    pairs = {tuple(sorted(int(index) for index in rng.choice(count, 2, replace=False) + 1)) for _ in range(count)}
+    return points, sorted(pairs)[::2], sorted(pairs)[1::2]
+
+
+def get_xy(point: QPointF):
+    return point.x(), point.y()
+
+
+# the nearest key closer than distance by scanning them all, ties go to the smallest key
+def get_nearest(distances: dict, distance: float):
+    return min(((dis, key) for key, dis in distances.items() if dis < distance), default=(None, None))[1]
+
+
+def check(index: SpatialIndex, points: dict, lines: list, circles: list, seed: int):
+    rng = numpy.random.default_rng(seed)
+    for x, y in rng.uniform(-320, 320, (200, 2)):
+        point = QPointF(x, y)
+        point_distances = {key: math.hypot(p.x() - x, p.y() - y) for key, p in points.items()}
+        line_distances = {(a, b): get_segment_distance(x, y, *get_xy(points[a]), *get_xy(points[b])) for a, b in lines}
+        circle_distances = {
+            (a, b): math.fabs(point_distances[a] - math.dist(get_xy(points[a]), get_xy(points[b]))) for a, b in circles
+        }
+        for distance in (5, 20, 80):
+            assert index.get_point_index(point, distance) == get_nearest(point_distances, distance)
+            assert index.get_line_key(point, distance) == get_nearest(line_distances, distance)
+            assert index.get_circle_key(point, distance) == get_nearest(circle_distances, distance)
+
+
+def build(points: dict, lines: list, circles: list, cell_size: float):
+    index = SpatialIndex(cell_size)
+    for key, point in points.items():
+        index.set_point(key, point)
+    for key in lines:
+        index.set_line(key, points[key[0]], points[key[1]])
+    for key in circles:
+        index.set_circle(key, points[key[0]], points[key[1]])
+    return index
+
+
+@pytest.mark.parametrize('cell_size', (16, 64, 1000))
+def test_queries_match_a_full_scan(cell_size: float):
+    points, lines, circles = get_shapes(0)
+    check(build(points, lines, circles, cell_size), points, lines, circles, 1)
+
+
+# erased and moved shapes leave no stale entries in the grids
+def test_incremental_updates():
+    points, lines, circles = get_shapes(2)
+    index = build(points, lines, circles, 64)
+    rng = numpy.random.default_rng(3)
+    for key in list(points)[:20]:
+        if key % 2:
+            points.pop(key)
+            index.remove_point(key)
+            for line in [line for line in lines if key in line]:
+                lines.remove(line)
+                index.remove_line(line)
+            for circle in [circle for circle in circles if key in circle]:
+                circles.remove(circle)
+                index.remove_circle(circle)
+        else:
+            points[key] = QPointF(*rng.uniform(-300, 300, 2))
+            index.set_point(key, points[key])
+            for line in lines:
+                if key in line:
+                    index.set_line(line, points[line[0]], points[line[1]])
+            for circle in circles:
+                if key in circle:
+                    index.set_circle(circle, points[circle[0]], points[circle[1]])
+    check(index, points, lines, circles, 4)
+    rebuilt = build(points, lines, circles, 64)
+    for grid, rebuilt_grid in (
+            (index.point_grid, rebuilt.point_grid), (index.line_grid, rebuilt.line_grid),
+            (index.circle_grid, rebuilt.circle_grid)
+    ):
+        assert grid.keys == rebuilt_grid.keys
+        assert grid.cells == rebuilt_grid.cells
@@ -165,9 +165,15 @@ class Ui_form(object):
         self.export_all_btn.setObjectName("export_all_btn")
         self.export_pivots_btn = QtWidgets.QAction(form)
         self.export_pivots_btn.setObjectName("export_pivots_btn")
+        self.prev_img_btn = QtWidgets.QAction(form)
+        self.prev_img_btn.setObjectName("prev_img_btn")
+        self.next_img_btn = QtWidgets.QAction(form)
+        self.next_img_btn.setObjectName("next_img_btn")
         self.menu_3.addAction(self.export_all_btn)
         self.menu_3.addAction(self.export_pivots_btn)
         self.menu.addAction(self.load_img_btn)
+        self.menu.addAction(self.prev_img_btn)
+        self.menu.addAction(self.next_img_btn)
         self.menu.addAction(self.delete_img_btn)
         self.menu.addAction(self.save_img_btn)
         self.menu.addAction(self.import_btn)
@@ -221,3 +227,7 @@ class Ui_form(object):
         self.export_all_btn.setShortcut(_translate("form", "Ctrl+A"))
         self.export_pivots_btn.setText(_translate("form", "关键点"))
         self.export_pivots_btn.setShortcut(_translate("form", "Ctrl+P"))
+        self.prev_img_btn.setText(_translate("form", "上一张"))
+        self.prev_img_btn.setShortcut(_translate("form", "PgUp"))
+        self.next_img_btn.setText(_translate("form", "下一张"))
+        self.next_img_btn.setShortcut(_translate("form", "PgDown"))